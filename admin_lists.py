@@ -0,0 +1,96 @@
+import csv
+import io
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from s3_storage import get_s3_client
+
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "30"))
+
+
+class AdminList:
+    """
+    An admins CSV (single `email` column) held in memory. The file is
+    revalidated with a conditional GET on its ETag at most every
+    ADMIN_CACHE_TTL seconds, and `save` writes through to the cache, so
+    membership checks normally make no S3 calls. Lookups are case-insensitive.
+    """
+
+    def __init__(self, bucket, key, ttl=ADMIN_CACHE_TTL):
+        self.bucket = bucket
+        self.key = key
+        self.ttl = ttl
+        # (emails in file order, lower-cased set), swapped as a unit
+        self._snapshot = None
+        self._etag = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self):
+        return self._snapshot is not None and time.monotonic() - self._checked_at < self.ttl
+
+    def _set(self, emails, etag):
+        self._snapshot = (emails, {email.strip().lower() for email in emails})
+        self._etag = etag
+        self._version = etag or f"local-{time.time_ns()}"
+        self._checked_at = time.monotonic()
+
+    def _get(self):
+        if self._is_fresh():
+            return self._snapshot
+        with self._lock:
+            if self._is_fresh():
+                return self._snapshot
+            s3 = get_s3_client()
+            params = {"Bucket": self.bucket, "Key": self.key}
+            if self._snapshot is not None and self._etag:
+                params["IfNoneMatch"] = self._etag
+            try:
+                obj = s3.get_object(**params)
+            except s3.exceptions.NoSuchKey:
+                self._set([], None)
+                return self._snapshot
+            except ClientError as e:
+                if e.response["ResponseMetadata"]["HTTPStatusCode"] != 304:
+                    raise
+                self._checked_at = time.monotonic()
+                return self._snapshot
+            reader = csv.DictReader(obj["Body"].read().decode("utf-8").splitlines())
+            self._set([row["email"] for row in reader if row.get("email")], obj["ETag"])
+            return self._snapshot
+
+    def emails(self):
+        """Admin emails as stored, in file order."""
+        return list(self._get()[0])
+
+    def version(self):
+        """Changes whenever the list does (the CSV ETag when known)."""
+        self._get()
+        return self._version
+
+    def contains(self, email):
+        return (email or "").strip().lower() in self._get()[1]
+
+    def save(self, emails):
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=["email"])
+        writer.writeheader()
+        for email in emails:
+            writer.writerow({"email": email})
+        try:
+            response = get_s3_client().put_object(
+                Bucket=self.bucket, Key=self.key, Body=output.getvalue().encode("utf-8")
+            )
+        except Exception:
+            self.invalidate()
+            raise
+        with self._lock:
+            self._set(list(emails), response.get("ETag"))
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
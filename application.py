@@ -9,31 +9,55 @@ from flask import (
     Response,
 )
 from flask_cors import CORS, cross_origin  # Import CORS
-import json, os
+import json, os, gzip, hashlib
+import click
+from concurrent.futures import ThreadPoolExecutor
 from utils import (
     #fetch_data,
     get_filtered_rows_count,
     add_data_request,
     get_request_data_from_storage,
     get_requests,
+    list_requests,
+    rebuild_request_index,
     #get_summarized_data,
     send_email,
     get_boolean_data_from_file,
+    get_boolean_data_page,
+    search_metrics,
+    MetricsCatalog,
+    BooleanData,
     get_authors_list,
     get_formatted_authors_response,
     fetch_pdf_data,
     fetch_qc_data,
     update_qc_csv_data,
     get_data_request_admins_list,
+    is_data_request_admin_email,
     save_data_request_admins_list,
     get_data_request_admins,
     add_data_request_admin,
     delete_data_request_admin,
+    update_request_status,
+    rebuild_request_analytics,
+    get_request_analytics,
+    reevaluate_requests,
+    BUCKET_NAME,
 )
 import collaborators_utils 
+from s3_storage import get_s3_client, get_s3_stats
+from botocore.exceptions import ClientError
+from mail_queue import enqueue_email, get_mail_results
+from artifacts import artifact_response
+from data_package import DATA_PACKAGES_PREFIX, build_data_package
 
 
 app_mode = os.getenv("FLASK_APP_MODE", "user")
+_bootstrap_executor = ThreadPoolExecutor(max_workers=int(os.getenv("BOOTSTRAP_WORKERS", "8")))
+# (BooleanData version, unfiltered baseline count) served by /bootstrap
+_bootstrap_rows_count = None
+# (ETag, gzipped body) of the last anonymous /bootstrap response
+_bootstrap_body = None
 application = Flask(__name__, static_folder="static/build")
 # CORS(application, resources={r"/*": {"origins": "http://localhost:3000"}})
 CORS(application)
@@ -128,8 +152,24 @@ def get_boolean_data():
         # Specific handling for preflight request if needed
         return _build_cors_preflight_response()
     staticPath = application.static_folder
-    result = get_boolean_data_from_file(staticPath)
-    return result
+    page_args = ("columns", "sites", "sessions", "cursor", "limit")
+    if any(arg in request.args for arg in page_args):
+        result = get_boolean_data_page(
+            staticPath,
+            columns=_split_arg(request.args.get("columns")),
+            sites=_split_arg(request.args.get("sites")),
+            sessions=_split_arg(request.args.get("sessions")),
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit", type=int),
+        )
+        if not result["success"]:
+            return jsonify({"error": result["message"]}), result["status"]
+        return Response(result["stream"], mimetype="application/json")
+    fmt = request.args.get("format", "records")
+    if fmt not in ("records", "columnar"):
+        return jsonify({"error": "Unknown format"}), 400
+    version, body = BooleanData.getPayload(staticPath, fmt)
+    return _build_compressed_response(body, etag=f"{version}-{fmt}")
 #BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 #METRICS_FILE = os.path.join(BASE_DIR, "metric-scripts", "metrics_data.json")
 
@@ -141,30 +181,105 @@ def get_metrics():
     if request.method == "OPTIONS":
         return _build_cors_preflight_response()
     try:
-        with open(application.static_folder + "/anonymized_data/metrics_data.json", "r") as file:
-        #with open(METRICS_FILE, "r") as file:
-            all_metrics = json.loads(file.read())
-            #behavioral_data = json.loads(file.read())
-            behavioral_data = {}
-            imaging_data = {}
-            for category, subcategories in all_metrics.items():
-                if category == 'Modality':
-                        continue
-                if(
-                    category.startswith(('Imaging', 'Image')) or 
-                    category in ['Lesion Information']
-                ):
-                    imaging_data[category] = subcategories
-                else:
-                    behavioral_data[category] = subcategories
-            data = {
-                "behavioral": behavioral_data,
-                "imaging": imaging_data
-            }
-        return data, 200
+        version, body = MetricsCatalog.getPayload(application.static_folder)
+        return _build_compressed_response(body, etag=f"metrics-{version}")
     except FileNotFoundError:
         return jsonify({"error": "File not found"}), 404
 
+@application.route("/metrics/search", methods=["GET", "OPTIONS"])
+@cross_origin()
+def search_metrics_route():
+    if request.method == "OPTIONS":
+        return _build_cors_preflight_response()
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", 20, type=int)
+    result = search_metrics(application.static_folder, query, limit)
+    if result["success"]:
+        return jsonify({"query": query, "results": result["results"]}), 200
+    return jsonify({"error": "Error"}), 500
+
+@application.route("/bootstrap", methods=["GET", "OPTIONS"])
+@cross_origin()
+def bootstrap():
+    """
+    Everything the SPA needs on page load (config, metrics, auth state and
+    the unfiltered baseline count) computed concurrently in one round trip.
+    The auth check only runs when a bearer token is sent.
+    """
+    if request.method == "OPTIONS":
+        return _build_cors_preflight_response()
+    static_folder = application.static_folder
+    auth_header = request.headers.get("Authorization", "")
+    id_token_str = auth_header.split("Bearer ")[1] if auth_header.startswith("Bearer ") else None
+    global _bootstrap_body
+
+    def load_metrics():
+        try:
+            return MetricsCatalog.getJson(static_folder)
+        except FileNotFoundError:
+            return None, "null"
+
+    def load_rows_count():
+        global _bootstrap_rows_count
+        version = BooleanData.getVersion(static_folder)
+        cached = _bootstrap_rows_count
+        if cached is not None and cached[0] == version:
+            return version, cached[1]
+        filters = {"timepoint": "baseline", "required_metrics": [], "or_groups": []}
+        count = get_filtered_rows_count(static_folder, filters)
+        if count.get("success"):
+            _bootstrap_rows_count = (version, count)
+        return version, count
+
+    def load_auth():
+        try:
+            decoded_token = collaborators_utils.verify_id_token(id_token_str)
+        except Exception as e:
+            print(f"Token verification failed: {e}")
+            return "unauthorized", {"status": 401, "data": {"message": "Unauthorized"}}
+        user_email = (decoded_token.get("email") or "").lower()
+        payload, status, stamp = collaborators_utils.AuthorizationCache.get(user_email)
+        return stamp, {"status": status, "data": payload}
+
+    futures = {
+        "metrics": _bootstrap_executor.submit(load_metrics),
+        "rows_count": _bootstrap_executor.submit(load_rows_count),
+    }
+    if id_token_str:
+        futures["auth"] = _bootstrap_executor.submit(load_auth)
+
+    # Each part is (version, value); a part that failed has no version, so no ETag
+    parts = {"auth": ("anonymous", None)}
+    for name, future in futures.items():
+        try:
+            parts[name] = future.result()
+        except Exception as e:
+            print(f"Error in bootstrap ({name}): {e}")
+            parts[name] = (None, "null" if name == "metrics" else None)
+    versions = [version for version, _ in parts.values()]
+    etag = None
+    if all(version is not None for version in versions):
+        stamp = "|".join([app_mode] + [f"{name}={parts[name][0]}" for name in sorted(parts)])
+        etag = hashlib.sha256(stamp.encode("utf-8")).hexdigest()[:16]
+    if etag and etag in request.if_none_match:
+        return _build_compressed_response(None, etag=etag)
+    # Anonymous page loads get identical bodies until a version changes
+    cached = _bootstrap_body
+    if etag and not id_token_str and cached is not None and cached[0] == etag:
+        return _build_compressed_response(cached[1], etag=etag)
+
+    body = "".join([
+        '{"auth":', json.dumps(parts["auth"][1], default=str, sort_keys=True),
+        ',"config":', json.dumps({"mode": app_mode}, sort_keys=True),
+        ',"metrics":', parts["metrics"][1],
+        ',"rows_count":', json.dumps(parts["rows_count"][1], default=str, sort_keys=True),
+        "}",
+    ])
+    gzipped = gzip.compress(body.encode("utf-8"))
+    if etag and not id_token_str:
+        _bootstrap_body = (etag, gzipped)
+    return _build_compressed_response(gzipped, etag=etag)
+
 # Data Request Admin Management Routes
 @application.route("/data-request/admins", methods=["GET", "OPTIONS"])
 @cross_origin()
@@ -204,7 +319,14 @@ def get_results():
 @cross_origin()
 def submit_request():
     data = json.loads(request.data)
-    response = add_data_request(data)
+    response = add_data_request(data, application.static_folder)
+    if response["success"] and response.get("duplicate"):
+        return jsonify({
+            "status": "success",
+            "message": response["message"],
+            "filename": response["filename"],
+            "duplicate": True,
+        }), 200
     if response["success"]:
         admin_email = "sarza@usc.edu"
         requestor_name = data["requestor"]["name"]
@@ -215,7 +337,7 @@ def submit_request():
                 f"{requestor_name} has submitted a new data request.\n"
                 f"Please refer to '{file_name}' in the S3 bucket to view the request details.\n\n"
         )
-        send_email(admin_email, subject, body)
+        enqueue_email(admin_email, subject, body)
         return jsonify({"status": "success", "message": response["message"]}), 200
     else:
         return (
@@ -234,9 +356,81 @@ def submit_request():
 def fetch_requests():
     if request.method == "OPTIONS":
         return _build_cors_preflight_response()
-    files_data = get_requests()
-        #print(files_data)
-    return jsonify(files_data), 200
+    list_args = ("page_size", "cursor", "status", "requester", "date_from", "date_to", "order")
+    if not any(arg in request.args for arg in list_args):
+        files_data = get_requests()
+            #print(files_data)
+        return jsonify(files_data), 200
+    try:
+        result = list_requests(
+            page_size=request.args.get("page_size", type=int),
+            cursor=request.args.get("cursor"),
+            status=request.args.get("status"),
+            requester=request.args.get("requester"),
+            date_from=request.args.get("date_from"),
+            date_to=request.args.get("date_to"),
+            descending=request.args.get("order", "desc") != "asc",
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), 200
+
+@application.route("/data-request/status", methods=["POST", "OPTIONS"])
+@cross_origin()
+@collaborators_utils.authenticate
+def update_request_status_route():
+    if request.method == "OPTIONS":
+        return _build_cors_preflight_response()
+    if not _is_data_request_admin(request.decoded_token):
+        return jsonify({"error": "Forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    result = update_request_status(data.get("file_name"), data.get("status"))
+    if not result["success"]:
+        return jsonify({"error": result["message"]}), result["status"]
+    return jsonify(result["request"]), 200
+
+@application.route("/data-request/analytics", methods=["GET", "OPTIONS"])
+@cross_origin()
+@collaborators_utils.authenticate
+def get_request_analytics_route():
+    if request.method == "OPTIONS":
+        return _build_cors_preflight_response()
+    if not _is_data_request_admin(request.decoded_token):
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(get_request_analytics(top=request.args.get("top", type=int))), 200
+
+@application.route("/data-request/package/<filename>", methods=["GET", "OPTIONS"])
+@cross_origin()
+@collaborators_utils.authenticate
+def download_data_package(filename):
+    """
+    Deliver a request's data package (or its manifest with ?artifact=manifest)
+    as a presigned URL by default, or streamed with ?delivery=stream.
+    """
+    if request.method == "OPTIONS":
+        return _build_cors_preflight_response()
+    try:
+        data_request = get_request_data_from_storage(filename)
+    except Exception:
+        return jsonify({"error": "Request not found"}), 404
+    user_email = (request.decoded_token.get("email") or "").lower()
+    if user_email != (data_request["email"] or "").lower() and not _is_data_request_admin(request.decoded_token):
+        return jsonify({"error": "Forbidden"}), 403
+
+    stem = os.path.splitext(filename)[0]
+    if request.args.get("artifact", "data") == "manifest":
+        key, download_name, content_type = f"{DATA_PACKAGES_PREFIX}{stem}/manifest.json", f"{stem}_manifest.json", "application/json"
+    else:
+        key, download_name, content_type = f"{DATA_PACKAGES_PREFIX}{stem}/{stem}.csv.gz", f"{stem}.csv.gz", "application/gzip"
+    s3_client = get_s3_client()
+    try:
+        s3_client.head_object(Bucket=BUCKET_NAME, Key=key)
+    except ClientError:
+        return jsonify({"error": "No data package has been built for this request"}), 404
+    return artifact_response(
+        BUCKET_NAME, key, download_name, content_type=content_type,
+        delivery=request.args.get("delivery", "url"),
+    )
 
 @application.route("/collaborators/pis-by-cohort", methods=["GET", "OPTIONS"])
 @cross_origin()
@@ -402,6 +596,14 @@ def send_invite_email():
         return _build_cors_preflight_response()
     return collaborators_utils.send_invite_email(request)
 
+@application.route("/collaborators/send_bulk_invites", methods=["POST", "OPTIONS"])
+@cross_origin()
+@collaborators_utils.authenticate
+def send_bulk_invites():
+    if request.method == "OPTIONS":
+        return _build_cors_preflight_response()
+    return collaborators_utils.send_bulk_invites(request)
+
 @application.route("/collaborators/upload_profile_picture", methods=["POST", "OPTIONS"])
 @cross_origin()
 @collaborators_utils.authenticate
@@ -450,6 +652,45 @@ def delete_admin():
         return _build_cors_preflight_response()
     return collaborators_utils.delete_admin(request)
 
+@application.route("/storage/stats", methods=["GET", "OPTIONS"])
+@cross_origin()
+@collaborators_utils.authenticate
+def get_storage_stats():
+    if request.method == "OPTIONS":
+        return _build_cors_preflight_response()
+    if not collaborators_utils.is_admin(request.decoded_token):
+        return jsonify({"message": "Forbidden"}), 403
+    return jsonify(get_s3_stats()), 200
+
+@application.route("/collaborators/write_stats", methods=["GET", "OPTIONS"])
+@cross_origin()
+@collaborators_utils.authenticate
+def get_collaborator_write_stats():
+    if request.method == "OPTIONS":
+        return _build_cors_preflight_response()
+    if not collaborators_utils.is_admin(request.decoded_token):
+        return jsonify({"message": "Forbidden"}), 403
+    return jsonify(collaborators_utils.get_collaborator_write_stats()), 200
+
+@application.route("/mail/results", methods=["GET", "OPTIONS"])
+@cross_origin()
+@collaborators_utils.authenticate
+def get_mail_status():
+    """
+    Outcomes of queued emails, optionally only ?job_id=<id> (repeatable).
+    Admins see every job; anyone else only the jobs they queued.
+    """
+    if request.method == "OPTIONS":
+        return _build_cors_preflight_response()
+    try:
+        job_ids = [int(job_id) for job_id in request.args.getlist("job_id")] or None
+    except ValueError:
+        return jsonify({"message": "Invalid job_id"}), 400
+    owner = None
+    if not collaborators_utils.is_admin(request.decoded_token):
+        owner = request.decoded_token.get("email") or ""
+    return jsonify(get_mail_results(job_ids, owner)), 200
+
 @application.route("/collaborators/check_admin_status", methods=["GET", "OPTIONS"])
 @cross_origin()
 @collaborators_utils.authenticate
@@ -459,6 +700,78 @@ def check_admin_status():
     return collaborators_utils.check_admin_status(request)
 
 
+@application.cli.command("rebuild-request-index")
+def rebuild_request_index_command():
+    """Regenerate data-requests/_index.json from the stored requests."""
+    index = rebuild_request_index()
+    print(f"Indexed {len(index['requests'])} data requests")
+
+@application.cli.command("rebuild-request-analytics")
+def rebuild_request_analytics_command():
+    """Recompute data-requests/_analytics.json from the stored requests."""
+    analytics = rebuild_request_analytics(application.static_folder)
+    print(f"Aggregated {analytics['requests']} data requests"
+          f" ({analytics['skipped']} malformed requests skipped)")
+
+@application.cli.command("reevaluate-requests")
+@click.option("--status", "statuses", multiple=True, default=["pending"],
+              help="Request statuses to include (repeatable).")
+def reevaluate_requests_command(statuses):
+    """Re-count stored requests against the current dataset and write a diff report."""
+    report = reevaluate_requests(application.static_folder, statuses)
+    changed = [r for r in report["requests"] if r["delta"]]
+    print(f"Evaluated {report['requests_evaluated']} requests "
+          f"({report['distinct_filters']} distinct filters) in {report['elapsed_seconds']}s; "
+          f"{len(changed)} changed since {report['previous_dataset_version']}")
+    for result in changed:
+        print(f"  {result['file_name']}: {result['old_count']} -> {result['new_count']} "
+              f"{result['site_deltas']}")
+
+@application.cli.command("build-data-package")
+@click.argument("file_name")
+def build_data_package_command(file_name):
+    """Extract a stored request's data from the master CSV into a gzip package on S3."""
+    manifest = build_data_package(application.static_folder, file_name)
+    print(f"Wrote {manifest['rows']} rows ({manifest['gzip_bytes']} bytes, "
+          f"{manifest['parts']} parts) to {manifest['object']}")
+    if manifest["missing_columns"]:
+        print(f"Columns not in the master CSV: {', '.join(manifest['missing_columns'])}")
+
+@application.cli.command("compact-collaborators")
+def compact_collaborators_command():
+    """Fold the collaborator changelog into a snapshot and regenerate the legacy CSV."""
+    summary = collaborators_utils.compact_collaborators()
+    print(f"Compacted {summary['records']} collaborators at changelog entry {summary['seq']} "
+          f"(rewrote {summary['record_objects']} record objects, pruned {summary['pruned']} changelog entries)")
+
+def _is_data_request_admin(decoded_token):
+    return (is_data_request_admin_email(decoded_token.get("email"))
+            or collaborators_utils.is_admin(decoded_token))
+
+def _split_arg(value):
+    if not value:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def _build_compressed_response(gzipped_body, etag=None, mimetype="application/json"):
+    """
+    Send a pre-compressed body as-is to clients that accept gzip and
+    decompress it for the rest. A matching If-None-Match yields a 304.
+    """
+    if etag and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    if "gzip" in request.accept_encodings:
+        response = Response(gzipped_body, mimetype=mimetype)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(gzip.decompress(gzipped_body), mimetype=mimetype)
+    response.headers["Vary"] = "Accept-Encoding"
+    if etag:
+        response.set_etag(etag)
+    return response
+
 def _build_cors_preflight_response():
     response = jsonify({"status": "success"})
     response.headers.add("Access-Control-Allow-Origin", "*")
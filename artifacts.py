@@ -0,0 +1,36 @@
+from flask import Response, jsonify, redirect
+
+from s3_storage import (
+    S3_PRESIGN_EXPIRES,
+    content_disposition,
+    presigned_download_url,
+    stream_object,
+)
+
+DELIVERY_MODES = ("url", "redirect", "stream")
+
+
+def artifact_response(bucket, key, filename, content_type="application/octet-stream", delivery="url"):
+    """
+    Deliver an S3 object to the client.
+
+    - "url": JSON with a short-lived presigned URL the client downloads from
+    - "redirect": 302 to the presigned URL
+    - "stream": proxy the object through this worker in chunks
+
+    "url" and "redirect" fall back to "stream" when presigning is unavailable.
+    """
+    if delivery not in DELIVERY_MODES:
+        return jsonify({"message": f"delivery must be one of: {', '.join(DELIVERY_MODES)}"}), 400
+    if delivery != "stream":
+        url = presigned_download_url(bucket, key, filename, content_type)
+        if url is not None:
+            if delivery == "redirect":
+                return redirect(url, code=302)
+            return jsonify({"url": url, "filename": filename, "expires_in": S3_PRESIGN_EXPIRES}), 200
+
+    chunks, content_length, stored_type = stream_object(bucket, key)
+    headers = {"Content-Disposition": content_disposition(filename)}
+    if content_length is not None:
+        headers["Content-Length"] = str(content_length)
+    return Response(chunks, mimetype=content_type or stored_type, headers=headers)
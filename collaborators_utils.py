@@ -1,8 +1,5 @@
 from flask import Flask, request, jsonify, Response
 import json
-import boto3
-import google.auth.transport.requests
-from google.oauth2 import id_token
 from functools import wraps
 import os
 import csv
@@ -10,9 +7,22 @@ import io
 from flask_cors import CORS
 import datetime
 from typing import List, Dict
-from utils import send_email
+from mail_queue import enqueue_email, enqueue_email_batch
+from s3_storage import get_s3_client
+from admin_lists import AdminList
+from firebase_auth import FirebaseTokenVerifier
+from artifacts import artifact_response
 import base64
+from urllib.parse import quote
+import hashlib
+import random
+import re
 import sys
+import threading
+import time
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
 
 csv.field_size_limit(sys.maxsize)
 
@@ -21,14 +31,44 @@ CORS(application)
 
 # Configuration variables
 FIREBASE_PROJECT_ID = os.environ.get("FIREBASE_PROJECT_ID", "collaborator-dir")
+TOKEN_VERIFIER = FirebaseTokenVerifier(FIREBASE_PROJECT_ID)
 S3_SECRET_KEY = os.getenv("AWS_SECRET_KEY", None)
 S3_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY", None)
 COLLABORATORS_BUCKET = os.environ.get("COLLABORATORS_BUCKET", "collaborators-dir")
 COLLABORATORS_KEY = os.environ.get("COLLABORATORS_KEY", "collaborators_new_test.csv")
 ADMINS_BUCKET = os.environ.get("ADMINS_BUCKET", "collaborators-dir")
 ADMINS_KEY = os.environ.get("ADMINS_KEY", "admins.csv")
+ADMINS = AdminList(ADMINS_BUCKET, ADMINS_KEY)
 SMTP_USERNAME = os.getenv("SMTP_USERNAME", None)
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", None)
+COLLABORATORS_REVALIDATE_SECONDS = float(os.getenv("COLLABORATORS_REVALIDATE_SECONDS", "10"))
+AUTH_DECISION_CACHE_SIZE = int(os.getenv("AUTH_DECISION_CACHE_SIZE", "2048"))
+COLLABORATORS_WRITE_MAX_RETRIES = int(os.getenv("COLLABORATORS_WRITE_MAX_RETRIES", "5"))
+CONDITIONAL_WRITE_CONFLICTS = ("PreconditionFailed", "ConditionalRequestConflict")
+# "csv" keeps the whole collaborator list in COLLABORATORS_KEY; "records" keeps
+# one JSON object per collaborator plus a changelog, and compact-collaborators
+# produces the CSV
+COLLABORATORS_STORAGE = os.getenv("COLLABORATORS_STORAGE", "csv").lower()
+# "records" mode: compact in the background after every this many changelog entries (0 = never)
+COLLABORATORS_COMPACT_EVERY = int(os.getenv("COLLABORATORS_COMPACT_EVERY", "50"))
+COLLABORATORS_RECORDS_PREFIX = os.getenv("COLLABORATORS_RECORDS_PREFIX", "collaborators/")
+COLLABORATORS_SNAPSHOT_KEY = COLLABORATORS_RECORDS_PREFIX + "snapshot.json"
+COLLABORATORS_CHANGELOG_PREFIX = COLLABORATORS_RECORDS_PREFIX + "changelog/"
+INVITE_BATCH_LIMIT = int(os.getenv("INVITE_BATCH_LIMIT", "100"))
+INVITE_RATE_LIMIT = float(os.getenv("INVITE_RATE_LIMIT", "5"))
+INVITE_SUBJECT = "Invitation to Join ENIGMA Collaborators"
+INVITE_BODY = '''
+        Hello,
+        
+        You have been invited to join the ENIGMA Collaborators directory.
+        To create your profile and join the team.
+
+        If you have any questions, please contact the ENIGMA team.
+        
+        Best regards,
+        ENIGMA Team
+        '''
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 
 
 JSON_LIST_FIELDS = [
@@ -226,6 +266,9 @@ def _serialize_collaborator_row(row: dict) -> dict:
 
     return out
 
+def verify_id_token(id_token_str):
+    return TOKEN_VERIFIER.verify(id_token_str)
+
 def authenticate(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -239,11 +282,7 @@ def authenticate(f):
             return jsonify({"message": "Unauthorized"}), 401
 
         try:
-            request_adapter = google.auth.transport.requests.Request()
-            decoded_token = id_token.verify_firebase_token(
-                id_token_str, request_adapter, audience=FIREBASE_PROJECT_ID
-            )
-            print(decoded_token)
+            decoded_token = verify_id_token(id_token_str)
             request.decoded_token = decoded_token
             return f(*args, **kwargs)
         except Exception as e:
@@ -260,59 +299,17 @@ def check_user_authorization(request):
     try:
         decoded_token = request.decoded_token
         user_email = (decoded_token.get("email") or "").lower()
-        
-        if not user_email:
-            return jsonify({"authorized": False, "message": "Email not found"}), 400
-        
-        # Check if user is in admins CSV
-        admins = get_admins_list()
-        is_admin = user_email in [a.lower() for a in admins]
-        
-        # Check if user is in collaborators CSV
-        collaborators = get_collaborators_data()
-        user_collab = None
-        for collab in collaborators:
-            if (collab.get("primary_email") or "").lower() == user_email:
-                user_collab = collab
-                break
-        
-        # Determine authorization
-        if is_admin:
-            is_active = user_collab.get("is_active", True) if user_collab else True
-            return jsonify({
-                "authorized": True,
-                "is_admin": True,
-                "is_collaborator": bool(user_collab),
-                "can_access_collaborators_console": True,
-                "can_access_data_request": True,
-                "is_active": is_active,
-                "user_details": user_collab
-            }), 200
-        elif user_collab:
-            # Collaborator only (not admin)
-            is_active = user_collab.get("is_active", True)
-            if not is_active:
-                return jsonify({
-                    "authorized": False,
-                    "message": "Your account is inactive. You cannot access the system. Please contact NPNL at npnlusc@gmail.com to reactivate your account."
-                }), 403
-            return jsonify({
-                "authorized": True,
-                "is_admin": False,
-                "is_collaborator": True,
-                "can_access_collaborators_console": True,
-                "can_access_data_request": True,
-                "is_active": is_active,
-                "user_details": user_collab
-            }), 200
-        
+        payload, status, stamp = AuthorizationCache.get(user_email)
+        if stamp is None:
+            return jsonify(payload), status
+        if request.if_none_match.contains(stamp):
+            response = Response(status=304)
         else:
-            # Not found in either CSV
-            return jsonify({
-                "authorized": False,
-                "message": "You are not authorized to access this system. Please contact NPNL at npnlusc@gmail.com."
-            }), 403
-            
+            response = jsonify(payload)
+            response.status_code = status
+        response.set_etag(stamp)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
     except Exception as e:
         print(f"Error in check_user_authorization: {e}")
         import traceback
@@ -321,44 +318,342 @@ def check_user_authorization(request):
             "authorized": False,
             "message": "Internal server error"
         }), 500
-    
+
+
+def get_authorization_state(user_email):
+    """
+    Authorization payload and HTTP status for a user email, independent of
+    the Flask request so it can also be computed off the request thread.
+    """
+    if not user_email:
+        return {"authorized": False, "message": "Email not found"}, 400
+
+    # Check if user is in admins CSV
+    is_admin = ADMINS.contains(user_email)
+
+    # Check if user is in collaborators CSV
+    user_collab = CollaboratorStore.findByPrimaryEmail(user_email)
+
+    # Determine authorization
+    if is_admin:
+        is_active = user_collab.get("is_active", True) if user_collab else True
+        return {
+            "authorized": True,
+            "is_admin": True,
+            "is_collaborator": bool(user_collab),
+            "can_access_collaborators_console": True,
+            "can_access_data_request": True,
+            "is_active": is_active,
+            "user_details": user_collab
+        }, 200
+    elif user_collab:
+        # Collaborator only (not admin)
+        is_active = user_collab.get("is_active", True)
+        if not is_active:
+            return {
+                "authorized": False,
+                "message": "Your account is inactive. You cannot access the system. Please contact NPNL at npnlusc@gmail.com to reactivate your account."
+            }, 403
+        return {
+            "authorized": True,
+            "is_admin": False,
+            "is_collaborator": True,
+            "can_access_collaborators_console": True,
+            "can_access_data_request": True,
+            "is_active": is_active,
+            "user_details": user_collab
+        }, 200
+
+    else:
+        # Not found in either CSV
+        return {
+            "authorized": False,
+            "message": "You are not authorized to access this system. Please contact NPNL at npnlusc@gmail.com."
+        }, 403
+
+
+class AuthorizationCache:
+    """
+    get_authorization_state results per email, kept until the collaborator
+    store or the admin list changes. Each decision carries a stamp derived
+    from both versions and the email, which /auth/check sends as its ETag.
+    """
+    _decisions = LRUCache(maxsize=AUTH_DECISION_CACHE_SIZE)
+    _version = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def getVersion(cls):
+        return f"{CollaboratorStore.getVersion()}|{ADMINS.version()}"
+
+    @classmethod
+    def get(cls, user_email):
+        """(payload, status, stamp) for an email; stamp is None when nothing was cached."""
+        user_email = (user_email or "").strip().lower()
+        if not user_email:
+            payload, status = get_authorization_state(user_email)
+            return payload, status, None
+        version = cls.getVersion()
+        with cls._lock:
+            if version != cls._version:
+                cls._decisions.clear()
+                cls._version = version
+            cached = cls._decisions.get(user_email)
+        if cached is None:
+            payload, status = get_authorization_state(user_email)
+            stamp = hashlib.sha256(f"{version}|{user_email}".encode("utf-8")).hexdigest()[:16]
+            cached = (payload, status, stamp)
+            with cls._lock:
+                if version == cls._version:
+                    cls._decisions[user_email] = cached
+        payload, status, stamp = cached
+        return dict(_copy_record(payload), version=stamp), status, stamp
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._decisions.clear()
+            cls._version = None
+
+
+def _copy_record(value):
+    """Copy of a parsed record's dicts and lists (much cheaper than deepcopy)."""
+    if isinstance(value, dict):
+        return {k: _copy_record(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_record(v) for v in value]
+    return value
+
+
+PI_ROLES = ["PI", "Co-PI"]
+
+
+def _normalize_name(name):
+    return (name or "").strip().lower()
+
+
+def _as_list(value):
+    if isinstance(value, str):
+        return [value] if value else []
+    return value or []
+
+
+class CollaboratorIndexes:
+    """
+    Hash indexes over one snapshot of the collaborator records. Every index
+    maps to positions in that snapshot's list; where several rows share a
+    key the first one wins, matching the linear scans they replace.
+    """
+
+    def __init__(self, records):
+        self.by_primary_email = {}
+        self.by_email = {}
+        self.by_index = {}
+        self.pis_by_last_name = {}
+        self.members_by_pi = {}
+        self.pis_by_cohort = {}
+        for position, record in enumerate(records):
+            primary = (record.get("primary_email") or "").lower()
+            if primary:
+                self.by_primary_email.setdefault(primary, position)
+            for email in [primary] + _as_list(record.get("email_list")):
+                email = str(email).strip().lower() if email else ""
+                if email:
+                    self.by_email.setdefault(email, position)
+            self.by_index.setdefault(str(record.get("index")), position)
+            for pi_name in {_normalize_name(pi) for pi in _as_list(record.get("pi_last_name")) if pi}:
+                self.members_by_pi.setdefault(pi_name, []).append(position)
+            if record.get("role") in PI_ROLES:
+                self.pis_by_last_name.setdefault(_normalize_name(record.get("last_name")), []).append(position)
+                for cohort in _as_list(record.get("cohort_enigma_list")):
+                    cohort = cohort.strip() if isinstance(cohort, str) else ""
+                    if cohort:
+                        self.pis_by_cohort.setdefault(cohort, []).append(position)
+
+    def find_pi(self, last_name):
+        positions = self.pis_by_last_name.get(_normalize_name(last_name))
+        return positions[0] if positions else None
+
+
+class CollaboratorStore:
+    """
+    Parsed collaborator records shared by every request in the process,
+    with CollaboratorIndexes rebuilt whenever the records change.
+    The CSV is revalidated with a conditional GET on its ETag at most every
+    COLLABORATORS_REVALIDATE_SECONDS, and replaced directly after this
+    process writes it. Callers get copies, since handlers edit records in place.
+    """
+    # (records, indexes), swapped as a unit so readers never see a mismatch
+    _snapshot = None
+    _etag = None
+    # Last changelog entry applied, in "records" storage mode
+    _seq = None
+    _version = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    @classmethod
+    def _is_fresh(cls):
+        return cls._snapshot is not None and time.monotonic() - cls._checked_at < COLLABORATORS_REVALIDATE_SECONDS
+
+    @classmethod
+    def _set_snapshot(cls, records, etag, seq=None):
+        cls._snapshot = (records, CollaboratorIndexes(records))
+        cls._etag = etag
+        cls._seq = seq
+        if seq is not None:
+            cls._version = f"seq-{seq}"
+        else:
+            cls._version = etag or f"local-{time.time_ns()}"
+        cls._checked_at = time.monotonic()
+
+    @classmethod
+    def _refresh_from_changelog(cls):
+        """
+        "records" mode: start from the last compaction snapshot (or the CSV
+        before the first one) and apply the changelog entries written since
+        the state already held, so a revalidation costs one LIST when
+        nothing changed and one GET per new entry otherwise.
+        """
+        s3 = get_s3_client()
+        if cls._snapshot is None or cls._seq is None:
+            records, seq = _load_collaborators_base(s3)
+        else:
+            records, seq = cls._snapshot[0], cls._seq
+        entries = _read_changelog(s3, seq)
+        if entries and entries[0]["seq"] != seq + 1:
+            print(f"Collaborators changelog jumps from {seq} to {entries[0]['seq']}, reloading")
+            records, seq = _load_collaborators_base(s3)
+            entries = _read_changelog(s3, seq)
+        if entries or cls._snapshot is None or cls._seq is None:
+            if entries:
+                records, seq = _apply_changelog(records, entries), entries[-1]["seq"]
+            cls._set_snapshot(records, None, seq)
+        else:
+            cls._checked_at = time.monotonic()
+        return cls._snapshot
+
+    @classmethod
+    def _get_data(cls, revalidate=False):
+        if not revalidate and cls._is_fresh():
+            return cls._snapshot
+        with cls._lock:
+            if not revalidate and cls._is_fresh():
+                return cls._snapshot
+            if COLLABORATORS_STORAGE == "records":
+                return cls._refresh_from_changelog()
+            params = {"Bucket": COLLABORATORS_BUCKET, "Key": COLLABORATORS_KEY}
+            if cls._snapshot is not None and cls._etag:
+                params["IfNoneMatch"] = cls._etag
+            try:
+                obj = get_s3_client().get_object(**params)
+            except ClientError as e:
+                if e.response["ResponseMetadata"]["HTTPStatusCode"] != 304:
+                    raise
+                cls._checked_at = time.monotonic()
+                return cls._snapshot
+            data = obj["Body"].read().decode("utf-8").splitlines()
+            cls._set_snapshot([_parse_collaborator_row(row) for row in csv.DictReader(data)], obj["ETag"])
+            return cls._snapshot
+
+    @classmethod
+    def getAll(cls):
+        return [_copy_record(record) for record in cls._get_data()[0]]
+
+    @classmethod
+    def getVersion(cls):
+        """Changes whenever the records do (the CSV ETag when known)."""
+        cls._get_data()
+        return cls._version
+
+    @classmethod
+    def getSnapshot(cls):
+        """Copies of all records plus the indexes that address them, for handlers that edit and save."""
+        records, indexes = cls._get_data()
+        return [_copy_record(record) for record in records], indexes
+
+    @classmethod
+    def getSnapshotForUpdate(cls):
+        """
+        Like getSnapshot, but revalidated against S3 first, and with the
+        version the records were read at (the CSV ETag, or the changelog
+        sequence in "records" mode) so the write can be made conditional on it.
+        """
+        cls._get_data(revalidate=True)
+        with cls._lock:
+            records, indexes = cls._snapshot
+            version = cls._seq if COLLABORATORS_STORAGE == "records" else cls._etag
+        return [_copy_record(record) for record in records], indexes, version
+
+    @classmethod
+    def _find(cls, index_name, key):
+        records, indexes = cls._get_data()
+        position = getattr(indexes, index_name).get(key)
+        return _copy_record(records[position]) if position is not None else None
+
+    @classmethod
+    def findByPrimaryEmail(cls, email):
+        return cls._find("by_primary_email", (email or "").lower())
+
+    @classmethod
+    def findByEmail(cls, email):
+        """Match the primary address or any alias in email_list."""
+        return cls._find("by_email", (email or "").strip().lower())
+
+    @classmethod
+    def findByIndex(cls, index):
+        return cls._find("by_index", str(index))
+
+    @classmethod
+    def knownEmails(cls):
+        return set(cls._get_data()[1].by_email)
+
+    @classmethod
+    def getMembersOf(cls, pi_last_name):
+        records, indexes = cls._get_data()
+        return [_copy_record(records[p]) for p in indexes.members_by_pi.get(_normalize_name(pi_last_name), [])]
+
+    @classmethod
+    def getPisByCohort(cls):
+        records, indexes = cls._get_data()
+        return {
+            cohort: [_copy_record(records[p]) for p in positions]
+            for cohort, positions in indexes.pis_by_cohort.items()
+        }
+
+    @classmethod
+    def replace(cls, rows, etag):
+        """Adopt the rows this process just wrote (as CSV string dicts) and their ETag."""
+        records = [_parse_collaborator_row(row) for row in rows]
+        with cls._lock:
+            cls._set_snapshot(records, etag)
+
+    @classmethod
+    def applyChangelogEntry(cls, entry):
+        """Adopt a changelog entry this process just wrote, if it follows the state held."""
+        with cls._lock:
+            if cls._snapshot is not None and cls._seq == entry["seq"] - 1:
+                cls._set_snapshot(_apply_changelog(cls._snapshot[0], [entry]), None, entry["seq"])
+            else:
+                cls._checked_at = 0.0
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._checked_at = 0.0
+
 
 # Helper functions
 def get_collaborators_data():
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY,
-        region_name="us-east-1",
-    )
-    obj = s3.get_object(Bucket=COLLABORATORS_BUCKET, Key=COLLABORATORS_KEY)
-    data = obj["Body"].read().decode("utf-8").splitlines()
-    reader = csv.DictReader(data)
-    collaborators = []
-    for row in reader:
-        collaborators.append(_parse_collaborator_row(row))
-   
-    return collaborators
+    return CollaboratorStore.getAll()
 
 
 def get_admins_list():
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY,
-        region_name="us-east-1",
-    )
-    obj = s3.get_object(Bucket=ADMINS_BUCKET, Key=ADMINS_KEY)
-    data = obj["Body"].read().decode("utf-8").splitlines()
-    reader = csv.DictReader(data)
-    admins = [row["email"] for row in reader]
-    return admins
+    return ADMINS.emails()
 
 
 def is_admin(decoded_token):
-    user_email = decoded_token.get("email")
-    admins = get_admins_list()
-    return user_email in admins
+    return ADMINS.contains(decoded_token.get("email"))
 
 # Helper function to update S3 CSV
 def update_s3_csv(bucket, key, data, fieldnames):
@@ -368,75 +663,353 @@ def update_s3_csv(bucket, key, data, fieldnames):
     writer.writerows(data)
     csv_data = output.getvalue()
 
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY,
-        region_name="us-east-1",
-    )
+    s3 = get_s3_client()
     s3.put_object(Bucket=bucket, Key=key, Body=csv_data.encode("utf-8"))
 
-def update_s3_collaborators_csv(collaborators: List[dict]):
+COLLABORATOR_FIELDNAMES = [
+    "index",
+    "timestamp",
+    "primary_email",
+    "email_list",
+    "first_name",
+    "last_name",
+    "MI",
+    "degrees",
+    "orcid",
+    "department_list",
+    "university_list",
+    "address_list",
+    "city_list",
+    "state_list",
+    "country_list",
+    "cohort_enigma_list",
+    "cohort_orig_list",
+    "role",
+    "pi_last_name",
+    "profile_picture",
+    "active_members",
+    "former_members",
+    "cohort_funding",
+    'cohort_contributors',
+    "funding_ack",
+    "disclosures",
+    "members_initialized",
+    "is_active",
+    "blanket_opt_in",
+]
+
+
+def _collaborator_csv_row(collab: dict) -> dict:
+    """A collaborator as the string row written to (and read back from) the CSV."""
+    flat_row = _serialize_collaborator_row(collab)
+    values = {field: flat_row.get(field) for field in COLLABORATOR_FIELDNAMES}
+    return {field: "" if value is None else str(value) for field, value in values.items()}
+
+
+def _collaborators_csv(collaborators: List[dict]):
+    """(CSV text, string rows) for a list of collaborator dicts."""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=COLLABORATOR_FIELDNAMES)
+    writer.writeheader()
+
+    rows = [_collaborator_csv_row(collab) for collab in collaborators]
+    writer.writerows(rows)
+    return output.getvalue(), rows
+
+
+def update_s3_collaborators_csv(collaborators: List[dict], if_match: str = None):
     """
     Write the list of collaborator dicts back to S3 in the same
-    new CSV format.
+    new CSV format. With `if_match`, the write only succeeds if the
+    object still has that ETag.
     """
     if not collaborators:
         return
 
-    fieldnames = [
-        "index",
-        "timestamp",
-        "primary_email",
-        "email_list",
-        "first_name",
-        "last_name",
-        "MI",
-        "degrees",
-        "orcid",
-        "department_list",
-        "university_list",
-        "address_list",
-        "city_list",
-        "state_list",
-        "country_list",
-        "cohort_enigma_list",
-        "cohort_orig_list",
-        "role",
-        "pi_last_name",
-        "profile_picture",
-        "active_members",
-        "former_members",
-        "cohort_funding",
-        'cohort_contributors',
-        "funding_ack",
-        "disclosures",
-        "members_initialized",
-        "is_active",
-        "blanket_opt_in",
-    ]
+    csv_data, rows = _collaborators_csv(collaborators)
 
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
+    s3 = get_s3_client()
+    precondition = {"IfMatch": if_match} if if_match else {}
+    try:
+        response = s3.put_object(
+            Bucket=COLLABORATORS_BUCKET,
+            Key=COLLABORATORS_KEY,
+            Body=csv_data.encode("utf-8"),
+            **precondition,
+        )
+    except Exception:
+        CollaboratorStore.invalidate()
+        raise
+    CollaboratorStore.replace(rows, response.get("ETag"))
 
-    for collab in collaborators:
-        flat_row = _serialize_collaborator_row(collab)
-        writer.writerow(flat_row)
 
-    csv_data = output.getvalue()
+def _collaborator_key(record: dict) -> str:
+    """Identity of a collaborator in "records" mode: its index, else its primary email."""
+    return str(record.get("index") or "").strip() or (record.get("primary_email") or "").strip().lower()
+
+
+def _record_object_key(key: str) -> str:
+    return f"{COLLABORATORS_RECORDS_PREFIX}records/{quote(key, safe='')}.json"
+
+
+def _changelog_key(seq: int) -> str:
+    return f"{COLLABORATORS_CHANGELOG_PREFIX}{seq:012d}.json"
+
+
+def _normalize_collaborator(collab: dict) -> dict:
+    """The record as it would read back from the CSV, so both storage modes hold identical records."""
+    return _parse_collaborator_row(_collaborator_csv_row(collab))
 
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY,
-        region_name="us-east-1",
+
+def _load_collaborators_base(s3):
+    """(records, seq) of the last compaction snapshot, or of the CSV at seq 0 before the first one."""
+    try:
+        obj = s3.get_object(Bucket=COLLABORATORS_BUCKET, Key=COLLABORATORS_SNAPSHOT_KEY)
+    except s3.exceptions.NoSuchKey:
+        obj = s3.get_object(Bucket=COLLABORATORS_BUCKET, Key=COLLABORATORS_KEY)
+        data = obj["Body"].read().decode("utf-8").splitlines()
+        return [_parse_collaborator_row(row) for row in csv.DictReader(data)], 0
+    snapshot = json.loads(obj["Body"].read().decode("utf-8"))
+    return snapshot["records"], snapshot["seq"]
+
+
+def _read_changelog(s3, after: int) -> List[dict]:
+    """Changelog entries with a sequence number above `after`, in order."""
+    keys = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(
+        Bucket=COLLABORATORS_BUCKET, Prefix=COLLABORATORS_CHANGELOG_PREFIX, StartAfter=_changelog_key(after)
+    ):
+        keys.extend(item["Key"] for item in page.get("Contents", []))
+    entries = []
+    for key in sorted(keys):
+        obj = s3.get_object(Bucket=COLLABORATORS_BUCKET, Key=key)
+        entries.append(json.loads(obj["Body"].read().decode("utf-8")))
+    return entries
+
+
+def _apply_changelog(records: List[dict], entries: List[dict]) -> List[dict]:
+    """
+    A new record list with the entries' upserts and deletes applied in order.
+    Deleted rows are left as None tombstones and dropped once at the end, so
+    catching up on many entries stays linear.
+    """
+    records = list(records)
+    positions = {}
+    for i, record in enumerate(records):
+        positions.setdefault(_collaborator_key(record), []).append(i)
+    for entry in entries:
+        for key in entry.get("deletes", []):
+            for i in positions.pop(key, []):
+                records[i] = None
+        for record in entry.get("upserts", []):
+            key = _collaborator_key(record)
+            if key in positions:
+                records[positions[key][-1]] = record
+            else:
+                positions[key] = [len(records)]
+                records.append(record)
+    return [record for record in records if record is not None]
+
+
+def _append_collaborator_changes(before: List[dict], after: List[dict], seq: int):
+    """
+    Record the difference between two versions of the collaborator list as
+    changelog entry seq + 1. The entry is created with IfNoneMatch="*", so
+    if another writer already took that number the put fails with a
+    conditional-write conflict and the caller re-applies its edit. Only the
+    changed records are then written to their per-record objects.
+    """
+    before_by_key = {_collaborator_key(record): record for record in before}
+    after_keys = set()
+    upserts = []
+    for record in after:
+        key = _collaborator_key(record)
+        after_keys.add(key)
+        if before_by_key.get(key) != record:
+            upserts.append(_normalize_collaborator(record))
+    deletes = [key for key in before_by_key if key not in after_keys]
+    if not upserts and not deletes:
+        return None
+
+    entry = {
+        "seq": seq + 1,
+        "time": datetime.datetime.now().isoformat(),
+        "upserts": upserts,
+        "deletes": deletes,
+    }
+    s3 = get_s3_client()
+    s3.put_object(
+        Bucket=COLLABORATORS_BUCKET,
+        Key=_changelog_key(entry["seq"]),
+        Body=json.dumps(entry).encode("utf-8"),
+        ContentType="application/json",
+        IfNoneMatch="*",
     )
+    CollaboratorStore.applyChangelogEntry(entry)
+    if COLLABORATORS_COMPACT_EVERY > 0 and entry["seq"] % COLLABORATORS_COMPACT_EVERY == 0:
+        threading.Thread(target=_compact_in_background, name="collaborators-compaction", daemon=True).start()
+    try:
+        for record in upserts:
+            _put_record_object(s3, _collaborator_key(record), record)
+        for key in deletes:
+            s3.delete_object(Bucket=COLLABORATORS_BUCKET, Key=_record_object_key(key))
+    except Exception as e:
+        # The changelog entry is the record of truth; the next compaction rewrites these
+        print(f"Error writing collaborator records for changelog entry {entry['seq']}: {e}")
+    return entry
+
+
+def _put_record_object(s3, key: str, record: dict):
+    s3.put_object(
+        Bucket=COLLABORATORS_BUCKET,
+        Key=_record_object_key(key),
+        Body=json.dumps(record).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+def compact_collaborators():
+    """
+    "records" mode: fold the changelog into snapshot.json, write the legacy
+    CSV (COLLABORATORS_KEY) that download_collaborators_csv serves, and
+    rewrite the per-record objects touched since the previous compaction
+    (all of them on the first run). Changelog entries older than the previous
+    snapshot are deleted; the ones since then are kept, so a writer that
+    fell behind still sees a gap and reloads. Runs every
+    COLLABORATORS_COMPACT_EVERY entries and from the hourly cron job in
+    .ebextensions.
+    """
+    if COLLABORATORS_STORAGE != "records":
+        raise RuntimeError("Compaction needs COLLABORATORS_STORAGE=records")
+    s3 = get_s3_client()
+    try:
+        head = s3.head_object(Bucket=COLLABORATORS_BUCKET, Key=COLLABORATORS_SNAPSHOT_KEY)
+        previous_seq = int(head.get("Metadata", {}).get("seq", -1))
+    except ClientError as e:
+        if e.response["ResponseMetadata"]["HTTPStatusCode"] != 404:
+            raise
+        previous_seq = None
+
+    records, _, seq = CollaboratorStore.getSnapshotForUpdate()
+    by_key = {_collaborator_key(record): record for record in records}
+    if previous_seq is None or previous_seq < 0:
+        touched = set(by_key)
+    else:
+        touched = set()
+        for entry in _read_changelog(s3, previous_seq):
+            if entry["seq"] > seq:
+                break
+            touched.update(_collaborator_key(record) for record in entry.get("upserts", []))
+            touched.update(entry.get("deletes", []))
+
     s3.put_object(
         Bucket=COLLABORATORS_BUCKET,
-        Key=COLLABORATORS_KEY,
-        Body=csv_data.encode("utf-8"),
+        Key=COLLABORATORS_SNAPSHOT_KEY,
+        Body=json.dumps({
+            "seq": seq,
+            "created": datetime.datetime.now().isoformat(),
+            "records": records,
+        }).encode("utf-8"),
+        ContentType="application/json",
+        Metadata={"seq": str(seq)},
     )
+    csv_data, _ = _collaborators_csv(records)
+    s3.put_object(Bucket=COLLABORATORS_BUCKET, Key=COLLABORATORS_KEY, Body=csv_data.encode("utf-8"))
+
+    def write_record(key):
+        if key in by_key:
+            _put_record_object(s3, key, by_key[key])
+        else:
+            s3.delete_object(Bucket=COLLABORATORS_BUCKET, Key=_record_object_key(key))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(write_record, touched))
+    pruned = _prune_changelog(s3, previous_seq) if previous_seq else 0
+    return {"seq": seq, "previous_seq": previous_seq, "records": len(records),
+            "record_objects": len(touched), "pruned": pruned}
+
+
+def _prune_changelog(s3, before: int) -> int:
+    """Delete the changelog entries numbered below `before`; returns how many."""
+    keys = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=COLLABORATORS_BUCKET, Prefix=COLLABORATORS_CHANGELOG_PREFIX):
+        keys.extend(item["Key"] for item in page.get("Contents", []) if item["Key"] < _changelog_key(before))
+    for start in range(0, len(keys), 1000):
+        s3.delete_objects(
+            Bucket=COLLABORATORS_BUCKET,
+            Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True},
+        )
+    return len(keys)
+
+
+_compaction_lock = threading.Lock()
+
+
+def _compact_in_background():
+    if not _compaction_lock.acquire(blocking=False):
+        return
+    try:
+        summary = compact_collaborators()
+        print(f"Compacted collaborators at changelog entry {summary['seq']}")
+    except Exception as e:
+        print(f"Error compacting collaborators: {e}")
+    finally:
+        _compaction_lock.release()
+
+
+class CollaboratorWriteConflict(Exception):
+    pass
+
+
+_write_stats = {"writes": 0, "conflicts": 0, "exhausted": 0}
+_write_stats_lock = threading.Lock()
+
+
+def _count_write(outcome):
+    with _write_stats_lock:
+        _write_stats[outcome] += 1
+
+
+def get_collaborator_write_stats():
+    """Conditional collaborator writes, conflicts retried, and mutations that gave up."""
+    with _write_stats_lock:
+        return dict(_write_stats)
+
+
+def _mutate_collaborators(mutate):
+    """
+    Apply `mutate(collaborators, indexes)` to the latest collaborator records
+    and write them back only if they are unchanged since they were read (CSV
+    ETag, or the next changelog sequence number in "records" mode). On a
+    conflicting write the records are re-read and `mutate` re-applied, so
+    concurrent edits aren't lost. `mutate` edits the list in place and
+    returns None to save it, or a value (e.g. an error response) to stop
+    without writing, which is returned as is. Returns None once saved.
+    """
+    for attempt in range(COLLABORATORS_WRITE_MAX_RETRIES):
+        collaborators, indexes, version = CollaboratorStore.getSnapshotForUpdate()
+        # "records" mode writes only what the edit changed, so keep the state it started from
+        before = [_copy_record(record) for record in collaborators] if COLLABORATORS_STORAGE == "records" else None
+        result = mutate(collaborators, indexes)
+        if result is not None:
+            return result
+        try:
+            if before is not None:
+                _append_collaborator_changes(before, collaborators, version)
+            else:
+                update_s3_collaborators_csv(collaborators, if_match=version)
+            _count_write("writes")
+            return None
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in CONDITIONAL_WRITE_CONFLICTS:
+                raise
+            _count_write("conflicts")
+            print(f"Collaborators changed during update (attempt {attempt + 1}), retrying")
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+    _count_write("exhausted")
+    raise CollaboratorWriteConflict("Collaborators CSV update conflicted too many times")
 
 def get_user_details(request):
     try:
@@ -445,12 +1018,7 @@ def get_user_details(request):
         if not user_email:
             return jsonify({"message": "Email not found in token"}), 400
 
-        collaborators = get_collaborators_data()
-        user_details = None
-        for collaborator in collaborators:
-            if (collaborator.get("primary_email") or "").lower() == user_email.lower():
-                user_details = collaborator
-                break
+        user_details = CollaboratorStore.findByPrimaryEmail(user_email)
 
         if not user_details:
             return jsonify({"message": "User not found"}), 404
@@ -470,7 +1038,7 @@ def get_user_details(request):
             pi_email = user_details.get("primary_email", "")
             pi_last_name = user_details.get("last_name", "")
             initialized = user_details.get("members_initialized", False)
-            all_potential_members = get_cohort_members(pi_last_name, collaborators, exclude_email=pi_email)
+            all_potential_members = get_cohort_members(pi_last_name, exclude_email=pi_email)
             # Only auto-fill if the field is missing entirely
             if not initialized:
                 user_details["active_members"] = all_potential_members
@@ -514,23 +1082,20 @@ Best regards,
 NPNL Team
 """
     try:
-        send_email(email, subject, body)
-        print(f"Inactive user email sent to {email}")
+        enqueue_email(email, subject, body)
+        print(f"Inactive user email queued for {email}")
     except Exception as e:
-        print(f"Failed to send inactive user email: {e}")
+        print(f"Failed to queue inactive user email: {e}")
 
-def get_user_role_and_cohorts(user_email: str, collaborators: List[dict]):
+def get_user_role_and_cohorts(user_email: str):
     """
     Returns (role, cohorts) for a given user email.
     Returns (None, []) if user not found.
     """
-    user_email = user_email.lower()
-    for collab in collaborators:
-        if (collab.get("primary_email") or "").lower() == user_email:
-            role = collab.get("role", "Member")
-            cohorts = collab.get("cohort_enigma_list", [])
-            return role, cohorts
-    return None, []
+    collab = CollaboratorStore.findByPrimaryEmail(user_email)
+    if collab is None:
+        return None, []
+    return collab.get("role", "Member"), collab.get("cohort_enigma_list", [])
 
 def upload_profile_picture(request):
     """
@@ -564,12 +1129,7 @@ def upload_profile_picture(request):
         filename = f"profile_pictures/{user_index}_{timestamp}.jpg"
         
         # Upload to S3
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=S3_ACCESS_KEY,
-            aws_secret_access_key=S3_SECRET_KEY,
-            region_name="us-east-1",
-        )
+        s3 = get_s3_client()
         
         s3.put_object(
             Bucket=COLLABORATORS_BUCKET,
@@ -624,12 +1184,7 @@ def delete_profile_picture(request):
             return jsonify({"message": "Invalid image URL"}), 400
         
         # Delete from S3
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=S3_ACCESS_KEY,
-            aws_secret_access_key=S3_SECRET_KEY,
-            region_name="us-east-1",
-        )
+        s3 = get_s3_client()
         
         s3.delete_object(
             Bucket=COLLABORATORS_BUCKET,
@@ -651,14 +1206,12 @@ def get_user_by_index(request):
         decoded_token = request.decoded_token
         user_email = (decoded_token.get("email") or "").lower()
 
-        collaborators = get_collaborators_data()
-
         # ----------- FIND TARGET USER BY INDEX -----------
         index = request.args.get("index")
         if not index:
             return jsonify({"message": "Missing index"}), 400
 
-        target = next((c for c in collaborators if str(c.get("index")) == str(index)), None)
+        target = CollaboratorStore.findByIndex(index)
         if not target:
             return jsonify({"message": "Not found"}), 404
 
@@ -668,7 +1221,7 @@ def get_user_by_index(request):
             pi_email = target.get("primary_email", "")
             pi_last_name = target.get("last_name", "")
             initialized = target.get("members_initialized", False)
-            all_potential_members = get_cohort_members(pi_last_name, collaborators, exclude_email=pi_email)
+            all_potential_members = get_cohort_members(pi_last_name, exclude_email=pi_email)
 
             # Only auto-populate if field is missing (None) – NOT if empty list
             if not initialized:
@@ -699,10 +1252,7 @@ def get_user_by_index(request):
             return jsonify(target), 200
 
         # ----------- CHECK IF USER IS A PI -----------
-        me = next(
-            (c for c in collaborators if (c.get("primary_email") or "").lower() == user_email),
-            None
-        )
+        me = CollaboratorStore.findByPrimaryEmail(user_email)
 
         if me and me.get("role") in ["PI", "Co-PI"]:
             my_last = (me.get("last_name") or "").strip().lower()
@@ -739,316 +1289,313 @@ def update_user_details(request):
         if not target_index:
             return jsonify({"message": "Missing index"}), 400
 
-        collaborators = get_collaborators_data()
-
-        # Find the target collaborator
-        target = None
-        target_idx = None
-        for idx, collab in enumerate(collaborators):
-            if str(collab.get("index")) == target_index:
-                target = collab
-                target_idx = idx
-                break
+        def apply(collaborators, indexes):
+            # Find the target collaborator
+            target_idx = indexes.by_index.get(target_index)
+            target = collaborators[target_idx] if target_idx is not None else None
 
-        if not target:
-            return jsonify({"message": "User not found"}), 404
+            if not target:
+                return jsonify({"message": "User not found"}), 404
+            # State before this update, for working out member list changes
+            original = _copy_record(target)
 
-        target_email = (target.get("primary_email") or "").lower()
+            target_email = (target.get("primary_email") or "").lower()
         
-        # Handle is_active toggle by admin
-        if "is_active" in user_updates and target.get("role") not in ["PI", "Co-PI"]:
-            new_is_active = user_updates.get("is_active")
-            target["is_active"] = new_is_active
-            target_pi_list = target.get("pi_last_name", [])
-            if isinstance(target_pi_list, str):
-                target_pi_list = [target_pi_list] if target_pi_list else []
+            # Handle is_active toggle by admin
+            if "is_active" in user_updates and target.get("role") not in ["PI", "Co-PI"]:
+                new_is_active = user_updates.get("is_active")
+                target["is_active"] = new_is_active
+                target_pi_list = target.get("pi_last_name", [])
+                if isinstance(target_pi_list, str):
+                    target_pi_list = [target_pi_list] if target_pi_list else []
+
+                # Find the PI for this member and update their lists
+                for pi_last_name in target_pi_list:
+                    idx = indexes.find_pi(pi_last_name)
+                    if idx is None:
+                        continue
+                    collab = collaborators[idx]
+                    pi_last_name = (collab.get("last_name") or "").strip().lower()
+                    member_info = {
+                        "first_name": target.get("first_name", ""),
+                        "last_name": target.get("last_name", ""),
+                        "email": target.get("primary_email", ""),
+                        "role": target.get("role", "Member"),
+                    }
+
+                    active_members = collab.get("active_members", [])
+                    former_members = collab.get("former_members", [])
 
-            # Find the PI for this member and update their lists
-            for pi_last_name in target_pi_list:
-                pi_last_name_lower = pi_last_name.strip().lower()
-                for idx, collab in enumerate(collaborators):
-                    if collab.get("role") in ["PI", "Co-PI"]:
-                        pi_last_name = (collab.get("last_name") or "").strip().lower()
-                        
-                        if pi_last_name == pi_last_name_lower:
-                            member_info = {
-                                "first_name": target.get("first_name", ""),
-                                "last_name": target.get("last_name", ""),
-                                "email": target.get("primary_email", ""),
-                                "role": target.get("role", "Member"),
-                            }
-                            
-                            active_members = collab.get("active_members", [])
-                            former_members = collab.get("former_members", [])
-                            
-                            active_members = [
-                                m for m in active_members 
-                                if isinstance(m, dict) and (m.get("email") or "").lower() != target_email
-                            ]
-                            former_members = [
-                                m for m in former_members 
-                                if isinstance(m, dict) and (m.get("email") or "").lower() != target_email
-                            ]
-                            
-                            if new_is_active:
-                                active_members.append(member_info)
-                                print(f"Moving {target_email} to active_members of PI {pi_last_name}")
-                            else:
-                                former_members.append(member_info)
-                                print(f"Moving {target_email} to former_members of PI {pi_last_name}")
-                            
-                            collaborators[idx]["active_members"] = active_members
-                            collaborators[idx]["former_members"] = former_members
-                            collaborators[idx]["members_initialized"] = True
-                            break
-
-        # ----------- UPDATE LOGIC -----------
-        target["timestamp"] = datetime.datetime.now().isoformat()
-        
-        if "is_active" in user_updates:
-            target["is_active"] = user_updates["is_active"]
+                    active_members = [
+                        m for m in active_members 
+                        if isinstance(m, dict) and (m.get("email") or "").lower() != target_email
+                    ]
+                    former_members = [
+                        m for m in former_members 
+                        if isinstance(m, dict) and (m.get("email") or "").lower() != target_email
+                    ]
 
-        # Handle email updates
-        emails = user_updates.get("emails") or user_updates.get("email_list") or []
-        if isinstance(emails, str):
-            emails = [emails]
-        emails = [e.strip() for e in emails if e and e.strip()]
-        if emails:
-            target["primary_email"] = emails[0]
-            target["email_list"] = emails
-        new_pi_list = target.get("pi_last_name", [])
-        if "pi_last_name" in user_updates and target.get("role") == "Member":
-            old_pi_list = target.get("pi_last_name", [])
-            new_pi_list = user_updates.get("pi_last_name", [])
+                    if new_is_active:
+                        active_members.append(member_info)
+                        print(f"Moving {target_email} to active_members of PI {pi_last_name}")
+                    else:
+                        former_members.append(member_info)
+                        print(f"Moving {target_email} to former_members of PI {pi_last_name}")
+
+                    collaborators[idx]["active_members"] = active_members
+                    collaborators[idx]["former_members"] = former_members
+                    collaborators[idx]["members_initialized"] = True
+
+            # ----------- UPDATE LOGIC -----------
+            target["timestamp"] = datetime.datetime.now().isoformat()
+        
+            if "is_active" in user_updates:
+                target["is_active"] = user_updates["is_active"]
+
+            # Handle email updates
+            emails = user_updates.get("emails") or user_updates.get("email_list") or []
+            if isinstance(emails, str):
+                emails = [emails]
+            emails = [e.strip() for e in emails if e and e.strip()]
+            if emails:
+                target["primary_email"] = emails[0]
+                target["email_list"] = emails
+            new_pi_list = target.get("pi_last_name", [])
+            if "pi_last_name" in user_updates and target.get("role") == "Member":
+                old_pi_list = target.get("pi_last_name", [])
+                new_pi_list = user_updates.get("pi_last_name", [])
             
-            # Ensure both are lists
-            if isinstance(old_pi_list, str):
-                old_pi_list = [old_pi_list] if old_pi_list else []
-            if isinstance(new_pi_list, str):
-                new_pi_list = [new_pi_list] if new_pi_list else []
+                # Ensure both are lists
+                if isinstance(old_pi_list, str):
+                    old_pi_list = [old_pi_list] if old_pi_list else []
+                if isinstance(new_pi_list, str):
+                    new_pi_list = [new_pi_list] if new_pi_list else []
             
-            old_pi_set = set(pi.strip().lower() for pi in old_pi_list if pi)
-            new_pi_set = set(pi.strip().lower() for pi in new_pi_list if pi)
+                old_pi_set = set(pi.strip().lower() for pi in old_pi_list if pi)
+                new_pi_set = set(pi.strip().lower() for pi in new_pi_list if pi)
             
-            # PIs removed from the list
-            removed_pis = old_pi_set - new_pi_set
-            # PIs added to the list
-            added_pis = new_pi_set - old_pi_set
+                # PIs removed from the list
+                removed_pis = old_pi_set - new_pi_set
+                # PIs added to the list
+                added_pis = new_pi_set - old_pi_set
             
-            member_email = target.get("primary_email", "").lower()
+                member_email = target.get("primary_email", "").lower()
             
-            # Remove member from PIs that were removed
-            for removed_pi_name in removed_pis:
-                for idx, collab in enumerate(collaborators):
-                    if collab.get("role") in ["PI", "Co-PI"]:
-                        pi_last_name = (collab.get("last_name") or "").strip().lower()
-                        
-                        if pi_last_name == removed_pi_name:
-                            # Remove from active_members
-                            active_members = collab.get("active_members", [])
-                            active_members = [
-                                m for m in active_members 
-                                if isinstance(m, dict) and (m.get("email") or "").lower() != member_email
-                            ]
-                            
-                            # Add to former_members
-                            former_members = collab.get("former_members", [])
-                            former_members = [
-                                m for m in former_members 
-                                if isinstance(m, dict) and (m.get("email") or "").lower() != member_email
-                            ]
-                            
-                            member_info = {
-                                "first_name": target.get("first_name", ""),
-                                "last_name": target.get("last_name", ""),
-                                "email": target.get("primary_email", ""),
-                                "role": "Member",
-                            }
-                            former_members.append(member_info)
-                            
-                            collaborators[idx]["active_members"] = active_members
-                            collaborators[idx]["former_members"] = former_members
-                            print(f"Removed member {member_email} from PI {removed_pi_name}'s active_members (moved to former)")
-                            break
+                # Remove member from PIs that were removed
+                for removed_pi_name in removed_pis:
+                    idx = indexes.find_pi(removed_pi_name)
+                    if idx is None:
+                        continue
+                    collab = collaborators[idx]
+                    # Remove from active_members
+                    active_members = collab.get("active_members", [])
+                    active_members = [
+                        m for m in active_members 
+                        if isinstance(m, dict) and (m.get("email") or "").lower() != member_email
+                    ]
+                
+                    # Add to former_members
+                    former_members = collab.get("former_members", [])
+                    former_members = [
+                        m for m in former_members 
+                        if isinstance(m, dict) and (m.get("email") or "").lower() != member_email
+                    ]
+                
+                    member_info = {
+                        "first_name": target.get("first_name", ""),
+                        "last_name": target.get("last_name", ""),
+                        "email": target.get("primary_email", ""),
+                        "role": "Member",
+                    }
+                    former_members.append(member_info)
+                
+                    collaborators[idx]["active_members"] = active_members
+                    collaborators[idx]["former_members"] = former_members
+                    print(f"Removed member {member_email} from PI {removed_pi_name}'s active_members (moved to former)")
             
-            # Add member to PIs that were added
-            for added_pi_name in added_pis:
-                for idx, collab in enumerate(collaborators):
-                    if collab.get("role") in ["PI", "Co-PI"]:
-                        pi_last_name = (collab.get("last_name") or "").strip().lower()
-                        
-                        if pi_last_name == added_pi_name:
-                            member_info = {
-                                "first_name": target.get("first_name", ""),
-                                "last_name": target.get("last_name", ""),
-                                "email": target.get("primary_email", ""),
-                                "role": "Member",
-                            }
-                            
-                            # Remove from former_members if present
-                            former_members = collab.get("former_members", [])
-                            former_members = [
-                                m for m in former_members 
-                                if isinstance(m, dict) and (m.get("email") or "").lower() != member_email
-                            ]
-                            
-                            # Add to active_members if not already there
-                            active_members = collab.get("active_members", [])
-                            member_exists = any(
-                                m.get("email", "").lower() == member_email
-                                for m in active_members if isinstance(m, dict)
-                            )
-                            
-                            if not member_exists:
-                                active_members.append(member_info)
-                            
-                            collaborators[idx]["active_members"] = active_members
-                            collaborators[idx]["former_members"] = former_members
-                            collaborators[idx]["members_initialized"] = True
-                            print(f"Added member {member_email} to PI {added_pi_name}'s active_members")
-                            break
-        if target.get("role") == "Member":
-            # Ensure new_pi_list is a list
-            if isinstance(new_pi_list, str):
-                new_pi_list = [new_pi_list] if new_pi_list else []
+                # Add member to PIs that were added
+                for added_pi_name in added_pis:
+                    idx = indexes.find_pi(added_pi_name)
+                    if idx is None:
+                        continue
+                    collab = collaborators[idx]
+                    member_info = {
+                        "first_name": target.get("first_name", ""),
+                        "last_name": target.get("last_name", ""),
+                        "email": target.get("primary_email", ""),
+                        "role": "Member",
+                    }
+                
+                    # Remove from former_members if present
+                    former_members = collab.get("former_members", [])
+                    former_members = [
+                        m for m in former_members 
+                        if isinstance(m, dict) and (m.get("email") or "").lower() != member_email
+                    ]
+                
+                    # Add to active_members if not already there
+                    active_members = collab.get("active_members", [])
+                    member_exists = any(
+                        m.get("email", "").lower() == member_email
+                        for m in active_members if isinstance(m, dict)
+                    )
+                
+                    if not member_exists:
+                        active_members.append(member_info)
+                
+                    collaborators[idx]["active_members"] = active_members
+                    collaborators[idx]["former_members"] = former_members
+                    collaborators[idx]["members_initialized"] = True
+                    print(f"Added member {member_email} to PI {added_pi_name}'s active_members")
+            if target.get("role") == "Member":
+                # Ensure new_pi_list is a list
+                if isinstance(new_pi_list, str):
+                    new_pi_list = [new_pi_list] if new_pi_list else []
             
-            if len(new_pi_list) == 0:
-                # No PIs left - set inactive
-                target["is_active"] = False
+                if len(new_pi_list) == 0:
+                    # No PIs left - set inactive
+                    target["is_active"] = False
                 
-            else:
-                # Still has at least one PI - set active
-                target["is_active"] = True
-
-        # Update other fields
-        for key in ["first_name", "last_name", "MI", "orcid", "role", "profile_picture", "pi_last_name", "blanket_opt_in"]:
-            if key in user_updates:
-                target[key] = user_updates[key]
-
-        # Update list fields
-        for key in ["degrees", "cohort_enigma_list", "cohort_orig_list", "active_members", 
-                    "former_members", "disclosures"]:
-            if key in user_updates:
-                target[key] = user_updates[key] if user_updates[key] is not None else []
+                else:
+                    # Still has at least one PI - set active
+                    target["is_active"] = True
+
+            # Update other fields
+            for key in ["first_name", "last_name", "MI", "orcid", "role", "profile_picture", "pi_last_name", "blanket_opt_in"]:
+                if key in user_updates:
+                    target[key] = _copy_record(user_updates[key])
+
+            # Update list fields (copied, so retries and the stored records never share the payload's lists)
+            for key in ["degrees", "cohort_enigma_list", "cohort_orig_list", "active_members", 
+                        "former_members", "disclosures"]:
+                if key in user_updates:
+                    target[key] = _copy_record(user_updates[key]) if user_updates[key] is not None else []
         
-        if "active_members" in user_updates or "former_members" in user_updates:
-            target["members_initialized"] = True
+            if "active_members" in user_updates or "former_members" in user_updates:
+                target["members_initialized"] = True
         
-        # Handle funding fields
-        if "funding" in user_updates:
-            target["funding_ack"] = user_updates["funding"] if user_updates["funding"] is not None else []
-        elif "funding_ack" in user_updates:
-            target["funding_ack"] = user_updates["funding_ack"] if user_updates["funding_ack"] is not None else []
-        if "cohort_contributors" in user_updates:
-            target["cohort_contributors"] = user_updates["cohort_contributors"]
-        if "cohort_funding" in user_updates:
-            target["cohort_funding"] = user_updates["cohort_funding"]
+            # Handle funding fields
+            if "funding" in user_updates:
+                target["funding_ack"] = _copy_record(user_updates["funding"]) if user_updates["funding"] is not None else []
+            elif "funding_ack" in user_updates:
+                target["funding_ack"] = _copy_record(user_updates["funding_ack"]) if user_updates["funding_ack"] is not None else []
+            if "cohort_contributors" in user_updates:
+                target["cohort_contributors"] = _copy_record(user_updates["cohort_contributors"])
+            if "cohort_funding" in user_updates:
+                target["cohort_funding"] = _copy_record(user_updates["cohort_funding"])
         
-        # Handle institutions
-        if "institutions" in user_updates and user_updates["institutions"]:
-            institutions = user_updates["institutions"]
-            if isinstance(institutions, list):
-                target["department_list"] = [inst.get("department", "") for inst in institutions]
-                target["university_list"] = [inst.get("university", "") for inst in institutions]
-                target["address_list"] = [inst.get("address", "") for inst in institutions]
-                target["city_list"] = [inst.get("city", "") for inst in institutions]
-                target["state_list"] = [inst.get("state", "") for inst in institutions]
-                target["country_list"] = [inst.get("country", "") for inst in institutions]
-            else:
-                target["department_list"] = [institutions.get("department", "")]
-                target["university_list"] = [institutions.get("university", "")]
-                target["address_list"] = [institutions.get("address", "")]
-                target["city_list"] = [institutions.get("city", "")]
-                target["state_list"] = [institutions.get("state", "")]
-                target["country_list"] = [institutions.get("country", "")]
-        collaborators[target_idx] = target
-
-        if "active_members" in user_updates or "former_members" in user_updates:
-            if target.get("role") in ["PI", "Co-PI"]:
-                # Get PI's last name
-                pi_last_name = (target.get("last_name") or "").strip()
-                # Get old and new former_members lists from the collaborators array
-                old_data = get_collaborators_data()[target_idx]
-                old_active_members = old_data.get("active_members", [])
-                old_former_members = old_data.get("former_members", [])
-                new_active_members = user_updates.get("active_members", target.get("active_members", []))
-                new_former_members = user_updates.get("former_members", target.get("former_members", []))
-                #old_former_members = get_collaborators_data()[target_idx].get("former_members", [])
-                #new_former_members = user_updates.get("former_members", [])
+            # Handle institutions
+            if "institutions" in user_updates and user_updates["institutions"]:
+                institutions = user_updates["institutions"]
+                if isinstance(institutions, list):
+                    target["department_list"] = [inst.get("department", "") for inst in institutions]
+                    target["university_list"] = [inst.get("university", "") for inst in institutions]
+                    target["address_list"] = [inst.get("address", "") for inst in institutions]
+                    target["city_list"] = [inst.get("city", "") for inst in institutions]
+                    target["state_list"] = [inst.get("state", "") for inst in institutions]
+                    target["country_list"] = [inst.get("country", "") for inst in institutions]
+                else:
+                    target["department_list"] = [institutions.get("department", "")]
+                    target["university_list"] = [institutions.get("university", "")]
+                    target["address_list"] = [institutions.get("address", "")]
+                    target["city_list"] = [institutions.get("city", "")]
+                    target["state_list"] = [institutions.get("state", "")]
+                    target["country_list"] = [institutions.get("country", "")]
+            collaborators[target_idx] = target
+
+            if "active_members" in user_updates or "former_members" in user_updates:
+                if target.get("role") in ["PI", "Co-PI"]:
+                    # Get PI's last name
+                    pi_last_name = (target.get("last_name") or "").strip()
+                    # Get old and new former_members lists from the collaborators array
+                    old_data = original
+                    old_active_members = old_data.get("active_members", [])
+                    old_former_members = old_data.get("former_members", [])
+                    new_active_members = user_updates.get("active_members", target.get("active_members", []))
+                    new_former_members = user_updates.get("former_members", target.get("former_members", []))
+                    #old_former_members = get_collaborators_data()[target_idx].get("former_members", [])
+                    #new_former_members = user_updates.get("former_members", [])
                 
-                #old_former_emails = {(m.get("email") or "").lower() for m in old_former_members if isinstance(m, dict)}
-                #new_former_emails = {(m.get("email") or "").lower() for m in new_former_members if isinstance(m, dict)}
-                old_active_emails = {(m.get("email") or "").lower() for m in old_active_members if isinstance(m, dict)}
-                old_former_emails = {(m.get("email") or "").lower() for m in old_former_members if isinstance(m, dict)}
-                new_active_emails = {(m.get("email") or "").lower() for m in new_active_members if isinstance(m, dict)}
-                new_former_emails = {(m.get("email") or "").lower() for m in new_former_members if isinstance(m, dict)}
-                # Members added to active list - add PI to their pi_last_name
-                newly_active = new_active_emails - old_active_emails - old_former_emails
-                for member_email in newly_active:
-                    for idx, collab in enumerate(collaborators):
-                        if (collab.get("primary_email") or "").lower() == member_email:
-                            # Get current PI list
-                            member_pi_list = collab.get("pi_last_name", [])
-                            if isinstance(member_pi_list, str):
-                                member_pi_list = [member_pi_list] if member_pi_list else []
-                            
-                            # Add this PI if not already in list
-                            if pi_last_name and pi_last_name not in member_pi_list:
-                                member_pi_list.append(pi_last_name)
-                                collaborators[idx]["pi_last_name"] = member_pi_list
-                                print(f"Added PI '{pi_last_name}' to member {member_email}'s PI list: {member_pi_list}")
-                            
-                            # Set member as active
-                            collaborators[idx]["is_active"] = True
-                            break
-                # Find newly added former members
-                newly_former = new_former_emails - old_former_emails
-                for member_email in newly_former:
-                    for idx, collab in enumerate(collaborators):
-                        if (collab.get("primary_email") or "").lower() == member_email:
-                            # Get current PI list
-                            member_pi_list = collab.get("pi_last_name", [])
-                            if isinstance(member_pi_list, str):
-                                member_pi_list = [member_pi_list] if member_pi_list else []
-                            # Remove this PI from list
-                            if pi_last_name in member_pi_list:
-                                member_pi_list.remove(pi_last_name)
-                                collaborators[idx]["pi_last_name"] = member_pi_list
-                                print(f"Removed PI '{pi_last_name}' from member {member_email}'s PI list: {member_pi_list}")
-                            # Only set inactive if no PIs left
-                            if len(member_pi_list) == 0:
-                                collaborators[idx]["is_active"] = False
-                                print(f"Setting {member_email} as inactive (no PIs left)")
-                            break
-                            #collaborators[idx]["is_active"] = False
-                            #print(f"Setting {member_email} as inactive (moved to former_members)")
-                            #break
+                    #old_former_emails = {(m.get("email") or "").lower() for m in old_former_members if isinstance(m, dict)}
+                    #new_former_emails = {(m.get("email") or "").lower() for m in new_former_members if isinstance(m, dict)}
+                    old_active_emails = {(m.get("email") or "").lower() for m in old_active_members if isinstance(m, dict)}
+                    old_former_emails = {(m.get("email") or "").lower() for m in old_former_members if isinstance(m, dict)}
+                    new_active_emails = {(m.get("email") or "").lower() for m in new_active_members if isinstance(m, dict)}
+                    new_former_emails = {(m.get("email") or "").lower() for m in new_former_members if isinstance(m, dict)}
+                    # Members added to active list - add PI to their pi_last_name
+                    newly_active = new_active_emails - old_active_emails - old_former_emails
+                    for member_email in newly_active:
+                        idx = indexes.by_primary_email.get(member_email)
+                        if idx is None:
+                            continue
+                        collab = collaborators[idx]
+                        # Get current PI list
+                        member_pi_list = collab.get("pi_last_name", [])
+                        if isinstance(member_pi_list, str):
+                            member_pi_list = [member_pi_list] if member_pi_list else []
+                    
+                        # Add this PI if not already in list
+                        if pi_last_name and pi_last_name not in member_pi_list:
+                            member_pi_list.append(pi_last_name)
+                            collaborators[idx]["pi_last_name"] = member_pi_list
+                            print(f"Added PI '{pi_last_name}' to member {member_email}'s PI list: {member_pi_list}")
+                    
+                        # Set member as active
+                        collaborators[idx]["is_active"] = True
+                    # Find newly added former members
+                    newly_former = new_former_emails - old_former_emails
+                    for member_email in newly_former:
+                        idx = indexes.by_primary_email.get(member_email)
+                        if idx is None:
+                            continue
+                        collab = collaborators[idx]
+                        # Get current PI list
+                        member_pi_list = collab.get("pi_last_name", [])
+                        if isinstance(member_pi_list, str):
+                            member_pi_list = [member_pi_list] if member_pi_list else []
+                        # Remove this PI from list
+                        if pi_last_name in member_pi_list:
+                            member_pi_list.remove(pi_last_name)
+                            collaborators[idx]["pi_last_name"] = member_pi_list
+                            print(f"Removed PI '{pi_last_name}' from member {member_email}'s PI list: {member_pi_list}")
+                        # Only set inactive if no PIs left
+                        if len(member_pi_list) == 0:
+                            collaborators[idx]["is_active"] = False
+                            print(f"Setting {member_email} as inactive (no PIs left)")
+                        #collaborators[idx]["is_active"] = False
+                        #print(f"Setting {member_email} as inactive (moved to former_members)")
                 
-                # Find reactivated members
-                reactivated = old_former_emails & new_active_emails
-                for member_email in reactivated:
-                    for idx, collab in enumerate(collaborators):
-                        if (collab.get("primary_email") or "").lower() == member_email:
-                            # Get current PI list
-                            member_pi_list = collab.get("pi_last_name", [])
-                            if isinstance(member_pi_list, str):
-                                member_pi_list = [member_pi_list] if member_pi_list else []
-                            
-                            # Add this PI back if not already in list
-                            if pi_last_name and pi_last_name not in member_pi_list:
-                                member_pi_list.append(pi_last_name)
-                                collaborators[idx]["pi_last_name"] = member_pi_list
-                                print(f"Reactivated: Added PI '{pi_last_name}' back to member {member_email}'s PI list: {member_pi_list}")
-                            
-                            # Reactivate member
-                            collaborators[idx]["is_active"] = True
-                            break
-
-        # Save back to S3
-        update_s3_collaborators_csv(collaborators)
+                    # Find reactivated members
+                    reactivated = old_former_emails & new_active_emails
+                    for member_email in reactivated:
+                        idx = indexes.by_primary_email.get(member_email)
+                        if idx is None:
+                            continue
+                        collab = collaborators[idx]
+                        # Get current PI list
+                        member_pi_list = collab.get("pi_last_name", [])
+                        if isinstance(member_pi_list, str):
+                            member_pi_list = [member_pi_list] if member_pi_list else []
+                    
+                        # Add this PI back if not already in list
+                        if pi_last_name and pi_last_name not in member_pi_list:
+                            member_pi_list.append(pi_last_name)
+                            collaborators[idx]["pi_last_name"] = member_pi_list
+                            print(f"Reactivated: Added PI '{pi_last_name}' back to member {member_email}'s PI list: {member_pi_list}")
+                    
+                        # Reactivate member
+                        collaborators[idx]["is_active"] = True
+
+        # Save back to S3, re-applying the update if the CSV changed meanwhile
+        response = _mutate_collaborators(apply)
+        if response is not None:
+            return response
 
         return jsonify({"message": "User details updated successfully"}), 200
 
+    except CollaboratorWriteConflict as e:
+        print(f"Error: {e}")
+        return jsonify({"message": "Collaborators were changed by someone else, please retry"}), 409
     except Exception as e:
         print(f"Error: {e}")
         import traceback
@@ -1061,30 +1608,20 @@ def get_pis_by_cohort():
     Returns a dictionary mapping cohort names to lists of PI information.
     """
     try:
-        collaborators = get_collaborators_data()
-        
         # Build a mapping of cohort -> list of PIs
         cohort_pi_map = {}
-        
-        for collab in collaborators:
-            if collab.get("role") in ["PI", "Co-PI"]:
-                cohorts = collab.get("cohort_enigma_list", [])
+
+        for cohort_name, pis in CollaboratorStore.getPisByCohort().items():
+            seen = set()
+            cohort_pis = []
+            for collab in pis:
                 pi_name = f"{collab.get('first_name', '')} {collab.get('last_name', '')}".strip()
-                role = collab.get("role", "")
-                
-                for cohort in cohorts:
-                    cohort_name = cohort.strip()
-                    if cohort_name:
-                        if cohort_name not in cohort_pi_map:
-                            cohort_pi_map[cohort_name] = []
-                        
-                        # Store name with role
-                        pi_info = {"name": pi_name, "role": role}
-                        
-                        # Check if this PI is not already in the list
-                        if pi_name and not any(p["name"] == pi_name for p in cohort_pi_map[cohort_name]):
-                            cohort_pi_map[cohort_name].append(pi_info)
-        
+                # Skip unnamed PIs and PIs already listed for this cohort
+                if pi_name and pi_name not in seen:
+                    seen.add(pi_name)
+                    cohort_pis.append({"name": pi_name, "role": collab.get("role", "")})
+            cohort_pi_map[cohort_name] = cohort_pis
+
         return cohort_pi_map
         
     except Exception as e:
@@ -1108,8 +1645,7 @@ def get_current_user_role(request):
                 "is_admin": True
             }), 200
         
-        collaborators = get_collaborators_data()
-        role, cohorts = get_user_role_and_cohorts(user_email, collaborators)
+        role, cohorts = get_user_role_and_cohorts(user_email)
         
         if role is None:
             return jsonify({"message": "User not found"}), 404
@@ -1141,64 +1677,62 @@ def delete_collaborator(request):
         if not target_index and not target_email:
             return jsonify({"message": "Missing index or email"}), 400
 
-        collaborators = get_collaborators_data()
-        # Find the collaborator to delete
-        deleted_collab = None
-        deleted_email = None
-
-        # Remove the collaborator
-        updated_collaborators = []
-        found = False
-        for collab in collaborators:
-            match = False
-            if target_index and str(collab.get("index")) == str(target_index):
-                match = True
-            elif target_email and (collab.get("primary_email") or "").lower() == target_email.lower():
-                match = True
-            if match:
-                deleted_collab = collab
-                deleted_email = (collab.get("primary_email") or "").lower()
-                break
-
-        if not deleted_collab:
-            return jsonify({"message": "Collaborator not found"}), 404
-        for collab in collaborators:
-            if collab.get("role") in ["PI", "Co-PI"]:
-                updated = False
-                # Remove from active_members
-                active_members = collab.get("active_members", [])
-                if active_members:
-                    original_count = len(active_members)
-                    active_members = [
-                        m for m in active_members 
-                        if isinstance(m, dict) and (m.get("email") or "").lower() != deleted_email
-                    ]
-                    if len(active_members) < original_count:
-                        collab["active_members"] = active_members
-                        updated = True
+        def apply(collaborators, indexes):
+            # Find the collaborator to delete
+            deleted_collab = None
+            deleted_email = None
+
+            position = indexes.by_index.get(str(target_index)) if target_index else None
+            if position is None and target_email:
+                position = indexes.by_primary_email.get(target_email.lower())
+            if position is not None:
+                deleted_collab = collaborators[position]
+                deleted_email = (deleted_collab.get("primary_email") or "").lower()
+
+            if not deleted_collab:
+                return jsonify({"message": "Collaborator not found"}), 404
+            for collab in collaborators:
+                if collab.get("role") in ["PI", "Co-PI"]:
+                    updated = False
+                    # Remove from active_members
+                    active_members = collab.get("active_members", [])
+                    if active_members:
+                        original_count = len(active_members)
+                        active_members = [
+                            m for m in active_members 
+                            if isinstance(m, dict) and (m.get("email") or "").lower() != deleted_email
+                        ]
+                        if len(active_members) < original_count:
+                            collab["active_members"] = active_members
+                            updated = True
                 
-                # Remove from former_members
-                former_members = collab.get("former_members", [])
-                if former_members:
-                    original_count = len(former_members)
-                    former_members = [
-                        m for m in former_members 
-                        if isinstance(m, dict) and (m.get("email") or "").lower() != deleted_email
-                    ]
-                    if len(former_members) < original_count:
-                        collab["former_members"] = former_members
-                        updated = True
-
-        updated_collaborators = []
-        for collab in collaborators:
-            # Skip the deleted collaborator
-            if collab.get("primary_email", "").lower() != deleted_email:
-                updated_collaborators.append(collab)
-
-        update_s3_collaborators_csv(updated_collaborators)
+                    # Remove from former_members
+                    former_members = collab.get("former_members", [])
+                    if former_members:
+                        original_count = len(former_members)
+                        former_members = [
+                            m for m in former_members 
+                            if isinstance(m, dict) and (m.get("email") or "").lower() != deleted_email
+                        ]
+                        if len(former_members) < original_count:
+                            collab["former_members"] = former_members
+                            updated = True
+
+            # Drop the deleted collaborator (in place, so the edit is saved)
+            collaborators[:] = [
+                collab for collab in collaborators
+                if collab.get("primary_email", "").lower() != deleted_email
+            ]
+
+        response = _mutate_collaborators(apply)
+        if response is not None:
+            return response
 
         return jsonify({"message": "Collaborator deleted successfully"}), 200
 
+    except CollaboratorWriteConflict as e:
+        print(f"Error: {e}")
+        return jsonify({"message": "Collaborators were changed by someone else, please retry"}), 409
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"message": "Internal server error"}), 500
@@ -1210,11 +1744,7 @@ def add_collaborator(request):
         admin = is_admin(decoded_token)
         if not admin:
             user_email = (decoded_token.get("email") or "").lower()
-            collaborators = get_collaborators_data()
-            current_user = next(
-                (c for c in collaborators if (c.get("primary_email") or "").lower() == user_email),
-                None
-            )
+            current_user = CollaboratorStore.findByPrimaryEmail(user_email)
             if not current_user or current_user.get("role") not in ["PI", "Co-PI"]:
                 return jsonify({"message": "Only Admins and PIs can add collaborators"}), 403
             is_pi = True
@@ -1234,134 +1764,133 @@ def add_collaborator(request):
 
         primary_email = emails[0]
 
-        collaborators = get_collaborators_data()
-
-        # Check if collaborator already exists by primary_email
-        for collab in collaborators:
-            if collab.get("primary_email", "").lower() == primary_email.lower():
+        def apply(collaborators, indexes):
+            # Check if collaborator already exists by primary_email
+            if primary_email.lower() in indexes.by_primary_email:
                 return jsonify({"message": "Collaborator already exists"}), 400
 
-        max_index = max([int(c.get("index") or 0) for c in collaborators], default=0)
-        institutions = payload.get("institutions", [])
-        department_list = []
-        university_list = []
-        address_list = []
-        city_list = []
-        state_list = []
-        country_list = []
-        for inst in institutions:
-            department_list.append(inst.get("department", ""))
-            university_list.append(inst.get("university", ""))
-            address_list.append(inst.get("address", ""))
-            city_list.append(inst.get("city", ""))
-            state_list.append(inst.get("state", ""))
-            country_list.append(inst.get("country", ""))
-        # If PI is adding, use empty cohort and default role
-        if is_pi:
-            cohort_enigma_list = []  # PIs can't set cohorts
-            cohort_orig_list = []
-            role = "Member"  # Default role for PI-added collaborators
-        else:
-            # Admin can set everything
-            cohort_enigma_list = payload.get("cohort_enigma_list", [])
-            cohort_orig_list = payload.get("cohort_orig_list", [])
-            role = payload.get("role", "")
-        if is_pi:
-            # PI is adding the member - use PI's last name as a single-item list
-            pi_last_name_list = [pi_last_name] if pi_last_name else []
-        else:
-            # Admin is adding - get from payload and ensure it's a list
-            pi_last_name_from_payload = payload.get("pi_last_name", [])
-            if isinstance(pi_last_name_from_payload, str):
-                # Convert string to list
-                pi_last_name_list = [pi_last_name_from_payload] if pi_last_name_from_payload else []
-            elif isinstance(pi_last_name_from_payload, list):
-                # Already a list
-                pi_last_name_list = pi_last_name_from_payload
+            max_index = max([int(c.get("index") or 0) for c in collaborators], default=0)
+            institutions = payload.get("institutions", [])
+            department_list = []
+            university_list = []
+            address_list = []
+            city_list = []
+            state_list = []
+            country_list = []
+            for inst in institutions:
+                department_list.append(inst.get("department", ""))
+                university_list.append(inst.get("university", ""))
+                address_list.append(inst.get("address", ""))
+                city_list.append(inst.get("city", ""))
+                state_list.append(inst.get("state", ""))
+                country_list.append(inst.get("country", ""))
+            # If PI is adding, use empty cohort and default role
+            if is_pi:
+                cohort_enigma_list = []  # PIs can't set cohorts
+                cohort_orig_list = []
+                role = "Member"  # Default role for PI-added collaborators
             else:
-                pi_last_name_list = []
-        new_collab = {
-            "index": str(max_index + 1),
-            "timestamp": datetime.datetime.now().isoformat(),
-            "primary_email": primary_email,
-            "email_list": emails,
-            "first_name": payload.get("first_name", "").strip(),
-            "last_name": payload.get("last_name", "").strip(),
-            "MI": payload.get("MI", "").strip(),
-            "degrees": payload.get("degrees", []),
-            "orcid": payload.get("orcid", "").strip(),
-            "profile_picture": payload.get("profile_picture", ""),
-            "department_list": department_list,
-            "university_list": university_list,
-            "address_list": address_list,
-            "city_list": city_list,
-            "state_list": state_list,
-            "country_list": country_list,
-            "cohort_enigma_list": cohort_enigma_list,
-            "cohort_orig_list": cohort_orig_list,
-            "role": role,
-            "pi_last_name": pi_last_name_list,
-            "members_initialized": False,
-            "is_active": True,
-            "active_members": payload.get("active_members", []),
-            "former_members": payload.get("former_members", []),
-            #"cohort_funding_ack": payload.get("cohort_funding_ack", ""),
-            #"contributing_members": payload.get("contributing_members", []),
-            "funding_ack": payload.get("funding", []),
-            "disclosures": payload.get("disclosures", []),
-            "blanket_opt_in": payload.get("blanket_opt_in", ""),
-        }
-
-        collaborators.append(new_collab)
-        # Add member to ALL selected PIs' active_members lists
-        if role == "Member" and pi_last_name_list:
-            member_info = {
-                "first_name": new_collab.get("first_name", ""),
-                "last_name": new_collab.get("last_name", ""),
-                "email": new_collab.get("primary_email", ""),
-                "role": "Member",
+                # Admin can set everything
+                cohort_enigma_list = _copy_record(payload.get("cohort_enigma_list", []))
+                cohort_orig_list = _copy_record(payload.get("cohort_orig_list", []))
+                role = payload.get("role", "")
+            if is_pi:
+                # PI is adding the member - use PI's last name as a single-item list
+                pi_last_name_list = [pi_last_name] if pi_last_name else []
+            else:
+                # Admin is adding - get from payload and ensure it's a list
+                pi_last_name_from_payload = payload.get("pi_last_name", [])
+                if isinstance(pi_last_name_from_payload, str):
+                    # Convert string to list
+                    pi_last_name_list = [pi_last_name_from_payload] if pi_last_name_from_payload else []
+                elif isinstance(pi_last_name_from_payload, list):
+                    # Already a list
+                    pi_last_name_list = list(pi_last_name_from_payload)
+                else:
+                    pi_last_name_list = []
+            new_collab = {
+                "index": str(max_index + 1),
+                "timestamp": datetime.datetime.now().isoformat(),
+                "primary_email": primary_email,
+                "email_list": list(emails),
+                "first_name": payload.get("first_name", "").strip(),
+                "last_name": payload.get("last_name", "").strip(),
+                "MI": payload.get("MI", "").strip(),
+                "degrees": _copy_record(payload.get("degrees", [])),
+                "orcid": payload.get("orcid", "").strip(),
+                "profile_picture": payload.get("profile_picture", ""),
+                "department_list": department_list,
+                "university_list": university_list,
+                "address_list": address_list,
+                "city_list": city_list,
+                "state_list": state_list,
+                "country_list": country_list,
+                "cohort_enigma_list": cohort_enigma_list,
+                "cohort_orig_list": cohort_orig_list,
+                "role": role,
+                "pi_last_name": pi_last_name_list,
+                "members_initialized": False,
+                "is_active": True,
+                "active_members": _copy_record(payload.get("active_members", [])),
+                "former_members": _copy_record(payload.get("former_members", [])),
+                #"cohort_funding_ack": payload.get("cohort_funding_ack", ""),
+                #"contributing_members": payload.get("contributing_members", []),
+                "funding_ack": _copy_record(payload.get("funding", [])),
+                "disclosures": _copy_record(payload.get("disclosures", [])),
+                "blanket_opt_in": payload.get("blanket_opt_in", ""),
             }
-            # Add to each PI's active_members list
-            for pi_name in pi_last_name_list:
-                pi_name_lower = pi_name.strip().lower()
-                for idx, collab in enumerate(collaborators):
-                    if collab.get("role") in ["PI", "Co-PI"]:
-                        collab_last_name = (collab.get("last_name") or "").strip().lower()
-                        if collab_last_name == pi_name_lower:
-                            # Initialize active_members if needed
-                            if "active_members" not in collab or not isinstance(collab["active_members"], list):
-                                collab["active_members"] = []
-                            
-                            # Check if member not already in list
-                            member_exists = any(
-                                m.get("email", "").lower() == primary_email.lower()
-                                for m in collab["active_members"]
-                                if isinstance(m, dict)
-                            )
-                            if not member_exists:
-                                collab["active_members"].append(member_info)
-                                collab["members_initialized"] = True
-                                collaborators[idx] = collab
-                            break
-        elif is_pi:
-            if "active_members" not in current_user or not isinstance(current_user["active_members"], list):
-                current_user["active_members"] = []
-
-            current_user["active_members"].append({
-                "first_name": new_collab.get("first_name", ""),
-                "last_name": new_collab.get("last_name", ""),
-                "email": new_collab.get("primary_email", "")
-            })
-
-            # Update PI row back in collaborators
-            for i, c in enumerate(collaborators):
-                if (c.get("primary_email") or "").lower() == user_email:
-                    collaborators[i] = current_user
-                    break
-        update_s3_collaborators_csv(collaborators)
+
+            collaborators.append(new_collab)
+            # Add member to ALL selected PIs' active_members lists
+            if role == "Member" and pi_last_name_list:
+                member_info = {
+                    "first_name": new_collab.get("first_name", ""),
+                    "last_name": new_collab.get("last_name", ""),
+                    "email": new_collab.get("primary_email", ""),
+                    "role": "Member",
+                }
+                # Add to each PI's active_members list
+                for pi_name in pi_last_name_list:
+                    idx = indexes.find_pi(pi_name)
+                    if idx is None:
+                        continue
+                    collab = collaborators[idx]
+                    # Initialize active_members if needed
+                    if "active_members" not in collab or not isinstance(collab["active_members"], list):
+                        collab["active_members"] = []
+                
+                    # Check if member not already in list
+                    member_exists = any(
+                        m.get("email", "").lower() == primary_email.lower()
+                        for m in collab["active_members"]
+                        if isinstance(m, dict)
+                    )
+                    if not member_exists:
+                        collab["active_members"].append(member_info)
+                        collab["members_initialized"] = True
+            elif is_pi:
+                # Update the PI's row as read for this attempt, not the earlier lookup
+                idx = indexes.by_primary_email.get(user_email)
+                if idx is not None:
+                    pi_row = collaborators[idx]
+                    if "active_members" not in pi_row or not isinstance(pi_row["active_members"], list):
+                        pi_row["active_members"] = []
+
+                    pi_row["active_members"].append({
+                        "first_name": new_collab.get("first_name", ""),
+                        "last_name": new_collab.get("last_name", ""),
+                        "email": new_collab.get("primary_email", "")
+                    })
+
+        response = _mutate_collaborators(apply)
+        if response is not None:
+            return response
 
         return jsonify({"message": "Collaborator added successfully"}), 201
 
+    except CollaboratorWriteConflict as e:
+        print(f"Error: {e}")
+        return jsonify({"message": "Collaborators were changed by someone else, please retry"}), 409
     except Exception as e:
         print(f"Error in add_collaborator: {e}")
         return jsonify({"message": "Internal server error"}), 500
@@ -1436,36 +1965,23 @@ def get_all_collaborators(request):
 
 def download_collaborators_csv(request):
     """
-    Download the raw CSV content from S3
+    Download the raw CSV from S3. Streams it by default; `?delivery=url` or
+    `?delivery=redirect` hand out a presigned URL so the transfer bypasses
+    the app worker. In "records" storage mode the CSV is the one
+    written by the last compact-collaborators run.
     """
     try:
         decoded_token = request.decoded_token
         
         if not is_admin(decoded_token):
             return jsonify({"message": "Only admins can download CSV"}), 403
-        
-        s3_client = boto3.client(
-            "s3",
-            aws_access_key_id=S3_ACCESS_KEY,
-            aws_secret_access_key=S3_SECRET_KEY,
-            region_name="us-east-1",
-        )
-        
-        response = s3_client.get_object(
-            Bucket=COLLABORATORS_BUCKET,
-            Key=COLLABORATORS_KEY
-        )
-        
-        # Read the CSV content
-        csv_content = response['Body'].read().decode('utf-8')
-        
-        # Return as file download
-        return Response(
-            csv_content,
-            mimetype="text/csv",
-            headers={
-                "Content-Disposition": "attachment; filename=collaborators.csv"
-            }
+
+        return artifact_response(
+            COLLABORATORS_BUCKET,
+            COLLABORATORS_KEY,
+            "collaborators.csv",
+            content_type="text/csv",
+            delivery=request.args.get("delivery", "stream"),
         )
         
     except Exception as e:
@@ -1474,37 +1990,22 @@ def download_collaborators_csv(request):
         traceback.print_exc()
         return jsonify({"message": "Internal server error"}), 500
     
-def get_cohort_members(pi_last_name: str, all_collaborators: List[dict], exclude_email: str = None) -> List[dict]:
+def get_cohort_members(pi_last_name: str, exclude_email: str = None) -> List[dict]:
     """
     Get all members whose pi_last_name matches the PI's last name.
     Excludes the PI themselves.
     """
-    members = []
     exclude_email_lower = (exclude_email or "").lower()
-    pi_last_name_lower = pi_last_name.strip().lower()
-    
-    for collab in all_collaborators:
-        collab_email = (collab.get("primary_email") or "").lower()
-        
-        # Skip the PI themselves
-        if collab_email == exclude_email_lower:
-            continue
-
-        # Also check if member's pi_last_name matches this PI's last name
-        member_pi_list = collab.get("pi_last_name", [])
-        if isinstance(member_pi_list, str):
-                    member_pi_list = [member_pi_list] if member_pi_list else []
-        has_matching_pi = any(pi.strip().lower() == pi_last_name_lower 
-            for pi in member_pi_list if pi)
-        
-        if has_matching_pi:
-            members.append({
-                "first_name": collab.get("first_name", ""),
-                "last_name": collab.get("last_name", ""),
-                "email": collab.get("primary_email", ""),
-                "role": collab.get("role", "Member"),
-            })
-    return members
+    return [
+        {
+            "first_name": collab.get("first_name", ""),
+            "last_name": collab.get("last_name", ""),
+            "email": collab.get("primary_email", ""),
+            "role": collab.get("role", "Member"),
+        }
+        for collab in CollaboratorStore.getMembersOf(pi_last_name)
+        if (collab.get("primary_email") or "").lower() != exclude_email_lower
+    ]
 
 
 def format_for_table(row):
@@ -1569,37 +2070,12 @@ def add_admin(request):
 
         new_admin_email = data["email"]
 
-        # Get current admins
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=S3_ACCESS_KEY,
-            aws_secret_access_key=S3_SECRET_KEY,
-            region_name="us-east-1",
-        )
-        obj = s3.get_object(Bucket=ADMINS_BUCKET, Key=ADMINS_KEY)
-        data = obj["Body"].read().decode("utf-8").splitlines()
-        reader = csv.DictReader(data)
-        admins = list(reader)
-
         # Check if the email is already an admin
-        for admin in admins:
-            if admin["email"] == new_admin_email:
-                return jsonify({"message": "User is already an admin"}), 400
-
-        # Add the new admin
-        admins.append({"email": new_admin_email})
-
-        # Write back to S3
-        fieldnames = ["email"]
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(admins)
-        csv_data = output.getvalue()
+        if ADMINS.contains(new_admin_email):
+            return jsonify({"message": "User is already an admin"}), 400
 
-        s3.put_object(
-            Bucket=ADMINS_BUCKET, Key=ADMINS_KEY, Body=csv_data.encode("utf-8")
-        )
+        # Add the new admin and write back to S3
+        ADMINS.save(get_admins_list() + [new_admin_email])
 
         return jsonify({"message": "Admin added successfully"}), 200
 
@@ -1622,11 +2098,10 @@ def delete_admin(request):
         admins = get_admins_list()
 
         # Remove the admin if they exist
-        if admin_email not in admins:
+        if not ADMINS.contains(admin_email):
             return jsonify({"message": "Admin not found"}), 404
 
-        updated_admins = [{"email": email} for email in admins if email != admin_email]
-        update_s3_csv(ADMINS_BUCKET, ADMINS_KEY, updated_admins, ["email"])
+        ADMINS.save([email for email in admins if email.strip().lower() != admin_email.strip().lower()])
 
         return jsonify({"message": "Admin deleted successfully"}), 200
 
@@ -1644,54 +2119,38 @@ def check_admin_status(request):
         print(f"Error: {e}")
         return jsonify({"message": "Internal server error"}), 500
 
+def _can_send_invites(decoded_token):
+    """Only PIs and Admins may invite new members."""
+    if is_admin(decoded_token):
+        return True
+    current_user = CollaboratorStore.findByPrimaryEmail(decoded_token.get("email"))
+    return bool(current_user) and current_user.get("role") == "PI"
+
 def send_invite_email(request):
     """
     Send an invitation email to a new member who doesn't exist in the system yet.
     """
     try:
-        decoded_token = request.decoded_token
-        user_email = (decoded_token.get("email") or "").lower()
-        
-        # Check if user is PI or Admin
-        admin = is_admin(decoded_token)
-        if not admin:
-            collaborators = get_collaborators_data()
-            current_user = next(
-                (c for c in collaborators if (c.get("primary_email") or "").lower() == user_email),
-                None
-            )
-            if not current_user or current_user.get("role") != "PI":
-                return jsonify({"message": "Only PIs and Admins can send invites"}), 403
+        if not _can_send_invites(request.decoded_token):
+            return jsonify({"message": "Only PIs and Admins can send invites"}), 403
 
         data = request.get_json()
         if not data or "email" not in data:
             return jsonify({"message": "Invalid request body"}), 400
 
         invite_email = data["email"]
-        sender_name = data.get("sender_name", "ENIGMA Team")
-        subject = "Invitation to Join ENIGMA Collaborators"
-        body = f'''
-        Hello,
-        
-        You have been invited to join the ENIGMA Collaborators directory.
-        To create your profile and join the team.
-
-        If you have any questions, please contact the ENIGMA team.
-        
-        Best regards,
-        ENIGMA Team
-        '''
-        success = send_email(
+        job_id = enqueue_email(
             recipient=invite_email,
-            subject=subject,
-            body=body
+            subject=INVITE_SUBJECT,
+            body=INVITE_BODY,
+            owner=request.decoded_token.get("email"),
         )
-        if success:
-            print(f"Invitation email sent successfully to {invite_email}")
-            return jsonify({"message": "Invitation email sent successfully"}), 200
-        else:
-            print(f"Failed to send invitation email to {invite_email}")
-            return jsonify({"message": "Failed to send invitation email"}), 500
+        print(f"Invitation email queued for {invite_email}")
+        return jsonify({
+            "message": "Invitation email queued",
+            "status": "queued",
+            "job_id": job_id,
+        }), 202
 
     except Exception as e:
         print(f"Error sending invite email: {e}")
@@ -1699,6 +2158,63 @@ def send_invite_email(request):
         traceback.print_exc()
         return jsonify({"message": "Internal server error"}), 500
 
+def send_bulk_invites(request):
+    """
+    Invite a list of addresses in one call. Addresses that already belong to
+    a collaborator (primary or alternate email), repeat within the list or
+    are malformed are skipped; the rest are handed to the mail worker, which
+    sends them over its SMTP session at no more than INVITE_RATE_LIMIT
+    messages per second. Returns right away with a job id per queued address;
+    the sender can look them up in /mail/results?job_id=<id>.
+    """
+    try:
+        data = request.get_json(silent=True)
+        emails = data.get("emails") if isinstance(data, dict) else None
+        if not isinstance(emails, list) or not emails:
+            return jsonify({"message": "Invalid request body"}), 400
+        if len(emails) > INVITE_BATCH_LIMIT:
+            return jsonify({"message": f"At most {INVITE_BATCH_LIMIT} invites per request"}), 400
+
+        if not _can_send_invites(request.decoded_token):
+            return jsonify({"message": "Only PIs and Admins can send invites"}), 403
+
+        existing = CollaboratorStore.knownEmails()
+        results = {}
+        to_send = []
+        for raw in emails:
+            email = str(raw or "").strip()
+            key = email.lower()
+            if key in results:
+                continue
+            if not EMAIL_PATTERN.match(email):
+                results[key] = {"email": email, "status": "invalid", "job_id": None}
+            elif key in existing:
+                results[key] = {"email": email, "status": "already_member", "job_id": None}
+            else:
+                results[key] = None
+                to_send.append(email)
+
+        job_ids = enqueue_email_batch(
+            [(email, INVITE_SUBJECT, INVITE_BODY) for email in to_send],
+            rate_limit=INVITE_RATE_LIMIT,
+            owner=request.decoded_token.get("email"),
+        )
+        for email, job_id in zip(to_send, job_ids):
+            results[email.lower()] = {"email": email, "status": "queued", "job_id": job_id}
+
+        results = list(results.values())
+        summary = {}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+        print(f"Bulk invite: {summary}")
+        return jsonify({"results": results, "summary": summary}), 202
+
+    except Exception as e:
+        print(f"Error sending bulk invites: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"message": "Internal server error"}), 500
+
 
 def check_collaborator_by_email(request):
     """
@@ -1710,28 +2226,17 @@ def check_collaborator_by_email(request):
         if not email:
             return jsonify({"message": "Email parameter is required"}), 400
         
-        email = email.lower().strip()
-        collaborators = get_collaborators_data()
-        
-        for collab in collaborators:
-            collab_email = (collab.get("primary_email") or "").lower()
-            # Also check in email_list
-            email_list = collab.get("email_list", [])
-            if isinstance(email_list, str):
-                try:
-                    email_list = json.loads(email_list)
-                except:
-                    email_list = [email_list]
-            
-            if collab_email == email or email in [e.lower() for e in email_list]:
-                return jsonify({
-                    "exists": True,
-                    "first_name": collab.get("first_name", ""),
-                    "last_name": collab.get("last_name", ""),
-                    "email": collab.get("primary_email", ""),
-                    "role": collab.get("role", "Member"),
-                    "index": collab.get("index", ""),
-                }), 200
+        # Matches the primary address or any alias in email_list
+        collab = CollaboratorStore.findByEmail(email)
+        if collab is not None:
+            return jsonify({
+                "exists": True,
+                "first_name": collab.get("first_name", ""),
+                "last_name": collab.get("last_name", ""),
+                "email": collab.get("primary_email", ""),
+                "role": collab.get("role", "Member"),
+                "index": collab.get("index", ""),
+            }), 200
         
         return jsonify({"exists": False}), 200
         
@@ -0,0 +1,205 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from s3_storage import get_s3_client
+from utils import (
+    BUCKET_NAME,
+    BooleanData,
+    get_request_data_from_storage,
+    request_filters,
+    request_metric_names,
+    working_dir,
+)
+
+MASTER_DB_PATH = os.getenv(
+    "MASTER_DB_PATH",
+    f"{working_dir}/faculty/sliew/enigma/new/BIDS/derivatives/master_db/master_ENIGMA_db_2024_10_11.csv",
+)
+DATA_PACKAGES_PREFIX = "data-packages/"
+DATA_PACKAGE_CHUNK_ROWS = int(os.getenv("DATA_PACKAGE_CHUNK_ROWS", "50000"))
+# S3 requires every part except the last to be at least 5 MiB
+DATA_PACKAGE_PART_SIZE = max(int(os.getenv("DATA_PACKAGE_PART_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+DATA_PACKAGE_UPLOAD_WORKERS = int(os.getenv("DATA_PACKAGE_UPLOAD_WORKERS", "4"))
+ID_COLUMNS = ["BIDS_ID", "SES"]
+
+
+class MultipartUploadWriter(io.RawIOBase):
+    """
+    Write-only file object that uploads what is written to it as an S3
+    multipart upload. Parts are sent from a thread pool as soon as
+    DATA_PACKAGE_PART_SIZE bytes are buffered; at most `max_pending` parts
+    are held in memory at once, so memory use doesn't grow with the object.
+    """
+
+    def __init__(self, s3_client, bucket, key, content_type="application/gzip",
+                 part_size=DATA_PACKAGE_PART_SIZE, workers=DATA_PACKAGE_UPLOAD_WORKERS):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self._buffer = bytearray()
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._upload_id = s3_client.create_multipart_upload(
+            Bucket=bucket, Key=key, ContentType=content_type
+        )["UploadId"]
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        self.size += len(data)
+        self.sha256.update(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _submit_part(self, body):
+        self._slots.acquire()
+        part_number = len(self._futures) + 1
+        future = self._executor.submit(self._upload_part, part_number, body)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _upload_part(self, part_number, body):
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            PartNumber=part_number, Body=body,
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def complete(self):
+        """Upload the remaining bytes and assemble the object; returns its ETag."""
+        if self._buffer or not self._futures:
+            self._submit_part(bytes(self._buffer))
+            self._buffer.clear()
+        try:
+            parts = [future.result() for future in self._futures]
+        finally:
+            self._executor.shutdown(wait=True)
+        response = self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+        return response.get("ETag")
+
+    def abort(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.s3_client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+        )
+
+    @property
+    def part_count(self):
+        return len(self._futures)
+
+
+def _session_keys(frame):
+    """(BIDS_ID, SES) pairs of a frame's rows, as strings."""
+    return pd.MultiIndex.from_arrays([frame["BIDS_ID"].astype(str), frame["SES"].astype(str)])
+
+
+def _matching_sessions(staticPath, filters):
+    """
+    (BIDS_ID, SES) pairs selected by a request's filters in the boolean
+    availability data. Its SESSION_IDs are anonymized, so only these columns
+    line up with the master CSV.
+    """
+    filtered = BooleanData.applyFiltersAndGetCount(
+        staticPath,
+        filters["required_metrics"],
+        session=filters["timepoint"],
+        or_groups=filters["or_groups"],
+    )
+    if isinstance(filtered, int) or filtered.empty:
+        return set()
+    return set(_session_keys(filtered))
+
+
+def build_data_package(staticPath, file_name, master_path=MASTER_DB_PATH):
+    """
+    Extract the sessions and metrics of a stored data request from the master
+    CSV into data-packages/<request>/<request>.csv.gz, plus a manifest.json
+    with row counts and checksums. The master CSV is read in chunks with only
+    the requested columns, and the gzip stream is uploaded part by part, so
+    memory stays bounded whatever the size of the extract.
+    """
+    request_data = get_request_data_from_storage(file_name)["data"]
+    filters = request_filters(request_data)
+    sessions = _matching_sessions(staticPath, filters)
+
+    header = pd.read_csv(master_path, nrows=0).columns
+    requested = sorted(request_metric_names(request_data))
+    columns = ID_COLUMNS + [col for col in requested if col in header and col not in ID_COLUMNS]
+    missing = [col for col in requested if col not in header]
+
+    stem = os.path.splitext(file_name)[0]
+    key = f"{DATA_PACKAGES_PREFIX}{stem}/{stem}.csv.gz"
+    s3_client = get_s3_client()
+    writer = MultipartUploadWriter(s3_client, BUCKET_NAME, key)
+    raw_sha256 = hashlib.sha256()
+    rows = 0
+    rows_per_site = {}
+    seen = set()
+    try:
+        with gzip.GzipFile(fileobj=writer, mode="wb") as gz:
+            first = True
+            for chunk in pd.read_csv(master_path, usecols=columns, chunksize=DATA_PACKAGE_CHUNK_ROWS):
+                chunk = chunk[columns]
+                session_keys = _session_keys(chunk)
+                keep = session_keys.isin(sessions) & ~session_keys.isin(seen) & ~session_keys.duplicated()
+                chunk = chunk[keep]
+                seen.update(session_keys[keep])
+                if chunk.empty and not first:
+                    continue
+                data = chunk.to_csv(index=False, header=first).encode("utf-8")
+                first = False
+                raw_sha256.update(data)
+                gz.write(data)
+                rows += len(chunk)
+                for site, count in chunk["BIDS_ID"].astype(str).str[4:8].str.upper().value_counts().items():
+                    rows_per_site[site] = rows_per_site.get(site, 0) + int(count)
+        etag = writer.complete()
+    except BaseException:
+        writer.abort()
+        raise
+
+    manifest = {
+        "request": file_name,
+        "object": key,
+        "etag": etag,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "dataset_version": BooleanData.getVersion(staticPath),
+        "master_db": os.path.basename(master_path),
+        "timepoint": filters["timepoint"],
+        "columns": columns,
+        "missing_columns": missing,
+        "sessions_matched": len(sessions),
+        "rows": rows,
+        "rows_per_site": dict(sorted(rows_per_site.items())),
+        "csv_sha256": raw_sha256.hexdigest(),
+        "gzip_sha256": writer.sha256.hexdigest(),
+        "gzip_bytes": writer.size,
+        "parts": writer.part_count,
+    }
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=f"{DATA_PACKAGES_PREFIX}{stem}/manifest.json",
+        Body=json.dumps(manifest, indent=2).encode("utf-8"),
+        ContentType="application/json",
+    )
+    return manifest
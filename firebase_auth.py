@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import google.auth.transport.requests
+import requests
+from cachetools import LRUCache
+from google.auth import exceptions, jwt
+
+FIREBASE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+# Used when the certs response carries no Cache-Control max-age
+FIREBASE_CERTS_DEFAULT_MAX_AGE = int(os.getenv("FIREBASE_CERTS_DEFAULT_MAX_AGE", "300"))
+FIREBASE_TOKEN_CACHE_SIZE = int(os.getenv("FIREBASE_TOKEN_CACHE_SIZE", "1024"))
+FIREBASE_HTTP_POOL_SIZE = int(os.getenv("FIREBASE_HTTP_POOL_SIZE", "10"))
+# Minimum spacing of refetches forced by an unknown `kid`, so tokens with a
+# bogus key id can't turn every request into a certs fetch
+FIREBASE_CERTS_MIN_REFRESH_SECONDS = float(os.getenv("FIREBASE_CERTS_MIN_REFRESH_SECONDS", "60"))
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+def _pooled_session(pool_size=FIREBASE_HTTP_POOL_SIZE):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class FirebaseTokenVerifier:
+    """
+    Verifies Firebase ID tokens the way id_token.verify_firebase_token does,
+    but fetches the signing certs over one pooled session and keeps them for
+    the Cache-Control max-age Google sends, and remembers tokens that already
+    passed verification (by sha256 of the token) until their `exp`, so repeat
+    requests with the same token cost neither a fetch nor an RSA check.
+    """
+
+    def __init__(self, audience, certs_url=FIREBASE_CERTS_URL, session=None,
+                 cache_size=FIREBASE_TOKEN_CACHE_SIZE, clock=time.time,
+                 min_refresh_interval=FIREBASE_CERTS_MIN_REFRESH_SECONDS):
+        self.audience = audience
+        self.certs_url = certs_url
+        self._transport = google.auth.transport.requests.Request(session=session or _pooled_session())
+        self._clock = clock
+        self._certs = None
+        self._certs_expire_at = 0.0
+        self._certs_fetched_at = None
+        self._min_refresh_interval = min_refresh_interval
+        self._certs_lock = threading.Lock()
+        self._tokens = LRUCache(maxsize=cache_size)
+        self._tokens_lock = threading.Lock()
+
+    def _fetch_certs(self):
+        response = self._transport(self.certs_url, method="GET")
+        if response.status != 200:
+            raise exceptions.TransportError(f"Could not fetch certificates at {self.certs_url}")
+        max_age = FIREBASE_CERTS_DEFAULT_MAX_AGE
+        match = MAX_AGE_PATTERN.search(response.headers.get("Cache-Control", "") or "")
+        if match:
+            max_age = int(match.group(1))
+        self._certs = json.loads(response.data.decode("utf-8"))
+        self._certs_fetched_at = self._clock()
+        self._certs_expire_at = self._certs_fetched_at + max_age
+
+    def _needs_fetch(self, kid):
+        certs = self._certs
+        now = self._clock()
+        if certs is None or now >= self._certs_expire_at:
+            return True
+        # Unknown kid: maybe a key rotation, but refetch at most once per interval
+        return (kid is not None and kid not in certs
+                and now - self._certs_fetched_at >= self._min_refresh_interval)
+
+    def get_certs(self, kid=None):
+        """
+        Signing certs, refetched when expired or when `kid` is unknown (key
+        rotation). Refetches for an unknown `kid` are limited to one per
+        min_refresh_interval; in between, the current certs are returned
+        and verification of such a token fails.
+        """
+        if not self._needs_fetch(kid):
+            return self._certs
+        with self._certs_lock:
+            if self._needs_fetch(kid):
+                self._fetch_certs()
+            return self._certs
+
+    def verify(self, id_token_str):
+        if isinstance(id_token_str, bytes):
+            id_token_str = id_token_str.decode("utf-8")
+        key = hashlib.sha256(id_token_str.encode("utf-8")).hexdigest()
+        now = self._clock()
+        with self._tokens_lock:
+            cached = self._tokens.get(key)
+        if cached is not None:
+            claims, expires_at = cached
+            if now < expires_at:
+                return dict(claims)
+            with self._tokens_lock:
+                self._tokens.pop(key, None)
+
+        kid = jwt.decode_header(id_token_str).get("kid")
+        claims = jwt.decode(id_token_str, certs=self.get_certs(kid), audience=self.audience)
+        expires_at = claims.get("exp")
+        if expires_at:
+            with self._tokens_lock:
+                self._tokens[key] = (dict(claims), float(expires_at))
+        return claims
+
+    def clear(self):
+        with self._tokens_lock:
+            self._tokens.clear()
+        with self._certs_lock:
+            self._certs = None
+            self._certs_expire_at = 0.0
+            self._certs_fetched_at = None
@@ -0,0 +1,229 @@
+import atexit
+import itertools
+import os
+import queue
+import smtplib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+SMTP_SERVER = os.getenv("SMTP_SERVER", "email-smtp.us-east-1.amazonaws.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+SMTP_USERNAME = os.getenv("SMTP_USERNAME", None)
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", None)
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+MAIL_SENDER = "npnlusc@gmail.com"
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+MAIL_BACKOFF_SECONDS = float(os.getenv("MAIL_BACKOFF_SECONDS", "1"))
+# Close the SMTP session after this long without mail; SES drops idle ones anyway
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "30"))
+MAIL_RESULTS_SIZE = 500
+# Default upper bound on messages per second for batches (SES defaults to 14/s)
+MAIL_RATE_LIMIT = float(os.getenv("MAIL_RATE_LIMIT", "10"))
+
+
+def build_message(recipient, subject, body, sender=MAIL_SENDER):
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = recipient
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, "plain"))
+    return msg
+
+
+class SMTPConnection:
+    """
+    An SMTP session that is opened (STARTTLS + login) on first use and kept
+    open for subsequent messages. Any failure closes it so the next send
+    starts from a fresh connection.
+    """
+
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, username=SMTP_USERNAME,
+                 password=SMTP_PASSWORD, use_tls=SMTP_USE_TLS, timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._server = None
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+
+    def send(self, msg):
+        if self._server is None:
+            self._connect()
+        try:
+            self._server.sendmail(msg["From"], msg["To"], msg.as_string())
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+
+
+class MailWorker:
+    """
+    Background sender: HTTP handlers enqueue messages and a single thread
+    drains the queue over one reused SMTP session, retrying failed sends with
+    exponential backoff and recording the outcome of every message. Messages
+    enqueued with a rate limit are spaced at least 1/rate_limit seconds apart.
+    """
+
+    def __init__(self, connection_factory=SMTPConnection, max_attempts=MAIL_MAX_ATTEMPTS,
+                 backoff_seconds=MAIL_BACKOFF_SECONDS, idle_timeout=MAIL_IDLE_TIMEOUT):
+        self._connection = connection_factory()
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self._results = OrderedDict()
+        self._results_lock = threading.Lock()
+        self._next_send = 0.0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="mail-worker", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, recipient, subject, body, rate_limit=None, owner=None):
+        """Queue a message; `owner` (who asked for it) is kept with its result."""
+        job_id = next(self._ids)
+        interval = 1.0 / rate_limit if rate_limit and rate_limit > 0 else 0.0
+        self._record(job_id, recipient, subject, "queued", 0, owner=owner)
+        self._queue.put((job_id, build_message(recipient, subject, body), interval, owner))
+        self.start()
+        return job_id
+
+    def enqueue_batch(self, messages, rate_limit=MAIL_RATE_LIMIT, owner=None):
+        """Queue (recipient, subject, body) tuples, rate limited; returns their job ids in order."""
+        return [self.enqueue(recipient, subject, body, rate_limit, owner) for recipient, subject, body in messages]
+
+    def join(self):
+        """Block until every queued message has been sent or given up on."""
+        self._queue.join()
+
+    def stop(self, timeout=10):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def results(self, job_ids=None, owner=None):
+        """Recent job outcomes, optionally only the given ids and/or those queued by `owner`."""
+        with self._results_lock:
+            results = list(self._results.values())
+        if job_ids is not None:
+            job_ids = set(job_ids)
+            results = [result for result in results if result["id"] in job_ids]
+        if owner is not None:
+            owner = owner.lower()
+            results = [result for result in results if result["owner"] and result["owner"].lower() == owner]
+        return results
+
+    def _record(self, job_id, recipient, subject, status, attempts, error=None, owner=None):
+        with self._results_lock:
+            self._results[job_id] = {
+                "id": job_id,
+                "recipient": recipient,
+                "subject": subject,
+                "status": status,
+                "attempts": attempts,
+                "error": error,
+                "owner": owner,
+                "updated_at": datetime.now().isoformat(),
+            }
+            self._results.move_to_end(job_id)
+            while len(self._results) > MAIL_RESULTS_SIZE:
+                self._results.popitem(last=False)
+
+    def _deliver(self, job_id, msg, owner=None):
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._connection.send(msg)
+                self._record(job_id, msg["To"], msg["Subject"], "sent", attempt, owner=owner)
+                return True
+            except Exception as e:
+                error = str(e)
+                print(f"Failed to send email to {msg['To']} (attempt {attempt}): {e}")
+                if attempt < self.max_attempts:
+                    time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+        self._record(job_id, msg["To"], msg["Subject"], "failed", self.max_attempts, error, owner)
+        return False
+
+    def _run(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._connection.close()
+                continue
+            try:
+                if job is None:
+                    self._connection.close()
+                    return
+                job_id, msg, interval, owner = job
+                if interval:
+                    delay = self._next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                self._deliver(job_id, msg, owner)
+                if interval:
+                    self._next_send = time.monotonic() + interval
+            finally:
+                self._queue.task_done()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_mail_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = MailWorker()
+            atexit.register(_worker.stop)
+        return _worker
+
+
+def enqueue_email(recipient, subject=None, body=None, owner=None):
+    """Queue an email for background delivery and return its job id."""
+    subject = subject or "NPNL Data Request Notification"
+    body = body or "A new data request has been submitted."
+    return get_mail_worker().enqueue(recipient, subject, body, owner=owner)
+
+
+def enqueue_email_batch(messages, rate_limit=MAIL_RATE_LIMIT, owner=None):
+    """Queue (recipient, subject, body) tuples for rate-limited background delivery."""
+    return get_mail_worker().enqueue_batch(messages, rate_limit, owner)
+
+
+def get_mail_results(job_ids=None, owner=None):
+    return get_mail_worker().results(job_ids, owner)
@@ -1,17 +1,21 @@
 from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
 import json
+import tempfile
+import time
 
 working_dir = os.getcwd().split('/faculty')[0]
 project_root = os.path.dirname(os.path.abspath(__file__))
 static_dir = os.path.join(project_root, "../static/anonymized_data")
 #os.makedirs(static_dir, exist_ok=True)
 metrics_dir = f'{working_dir}/faculty/sliew/enigma/new/infodb/metrics'
-metric_paths = [os.path.join(metrics_dir, file)
-                for file in os.listdir(metrics_dir)
-                if os.path.isfile(os.path.join(metrics_dir, file)) and not file.startswith('.')]
+metrics_path = os.path.join(static_dir, "metrics_data.json")
+# path -> {mtime, size, sha256, entries}; lets unchanged files be skipped without reading them
+manifest_path = os.path.join(project_root, "metrics_manifest.json")
+PARSE_WORKERS = int(os.getenv("METRICS_PARSE_WORKERS", "16"))
 
-categories = defaultdict(lambda: defaultdict(list))
 #for path in metric_paths:
 #	with open(path, 'r') as f:
 #		metric = json.load(f)
@@ -20,48 +24,170 @@ categories = defaultdict(lambda: defaultdict(list))
   #                                       "description": str(metric['description']).strip()
 	#				 })
 
-for path in metric_paths:
-   try:
-        if os.path.getsize(path) == 0:
-            continue
 
+def load_json(path, default):
+    try:
         with open(path, 'r') as f:
-            metric = json.load(f)
-        #print("Loaded metric:", metric)
-
-        #if metric['show']:
-        for key, metric in metric.items():
-            if metric['show']:
-                category = str(metric['category']).strip()
-                subcategory = str(metric.get('subcategory', '')).strip()
-                metric_info = {
-                "metric_name": str(metric['metric_name']).strip(),
-                "name": str(metric.get('name', metric['metric_name'])).strip(),
-                "variable_type": str(metric['variable_type']).strip(),
-                "description": str(metric['description']).strip(),
-                "show_order": metric.get('show_order'),
-                "essential": bool(metric.get("essential", False)),
-                "space": metric.get("space"),
-                }
-                categories[category][subcategory].append(metric_info)
-
-   except (IsADirectoryError, json.JSONDecodeError):
-        continue
-for category in categories:
-    for subcaregory in categories[category]:
-        categories[category][subcaregory] = sorted(
-            categories[category][subcaregory], key=lambda x: (x['show_order'] is None, 
-            x['show_order'] if x['show_order'] is not None else x['name'].lower()))
-	
-
-for category in categories:
-    categories[category] = OrderedDict(
-        sorted(categories[category].items(), key=lambda x: (x[0] == '', x[0]))
-    )
-categories = dict(sorted(categories.items()))
-
-#with open(os.getcwd() + '/metrics_data.json', 'w') as outfile:
- #   json.dump(categories, outfile, indent=4)
-metrics_path = os.path.join(static_dir, "metrics_data.json")
-with open(metrics_path, "w") as outfile:
-    json.dump(categories, outfile, indent=4)
\ No newline at end of file
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def write_json_atomic(path, data, indent=None):
+    """Write to a temp file in the same directory, then rename over the target."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as outfile:
+            json.dump(data, outfile, indent=indent)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def scan_metric_files():
+    stats = {}
+    with os.scandir(metrics_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError as e:
+                print(f"Skipping {entry.path}: {e}")
+                continue
+            stats[entry.path] = {"mtime": stat.st_mtime, "size": stat.st_size}
+    return stats
+
+
+def parse_metric_entries(metric):
+    entries = []
+    for key, metric in metric.items():
+        if metric['show']:
+            category = str(metric['category']).strip()
+            subcategory = str(metric.get('subcategory', '')).strip()
+            metric_info = {
+            "metric_name": str(metric['metric_name']).strip(),
+            "name": str(metric.get('name', metric['metric_name'])).strip(),
+            "variable_type": str(metric['variable_type']).strip(),
+            "description": str(metric['description']).strip(),
+            "show_order": metric.get('show_order'),
+            "essential": bool(metric.get("essential", False)),
+            "space": metric.get("space"),
+            }
+            entries.append({"category": category, "subcategory": subcategory, "metric": metric_info})
+    return entries
+
+
+def parse_metric_file(path, stat, previous):
+    """Return the manifest record for one metric file, re-parsing only if its content changed."""
+    record = {"mtime": stat["mtime"], "size": stat["size"], "sha256": None, "entries": []}
+    if stat["size"] == 0:
+        return record
+    with open(path, 'rb') as f:
+        content = f.read()
+    record["sha256"] = hashlib.sha256(content).hexdigest()
+    if previous and previous.get("sha256") == record["sha256"]:
+        record["entries"] = previous["entries"]
+        return record
+    try:
+        record["entries"] = parse_metric_entries(json.loads(content))
+    except (json.JSONDecodeError, UnicodeDecodeError, AttributeError, KeyError, TypeError) as e:
+        print(f"Skipping {path}: {e}")
+    return record
+
+
+def read_metric_file(path, stat, previous):
+    """parse_metric_file for the worker pool: a file that vanished or can't be read is logged and skipped."""
+    try:
+        return parse_metric_file(path, stat, previous)
+    except OSError as e:
+        print(f"Skipping {path}: {e}")
+        return None
+
+
+def sort_metrics(metrics):
+    return sorted(
+        metrics, key=lambda x: (x['show_order'] is None,
+        x['show_order'] if x['show_order'] is not None else x['name'].lower()))
+
+
+def main():
+    timings = OrderedDict()
+
+    start = time.perf_counter()
+    stats = scan_metric_files()
+    old_manifest = load_json(manifest_path, {})
+    previous_output = load_json(metrics_path, None)
+    timings["scan"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    changed = [
+        path for path, stat in stats.items()
+        if path not in old_manifest
+        or old_manifest[path]["mtime"] != stat["mtime"]
+        or old_manifest[path]["size"] != stat["size"]
+    ]
+    removed = [path for path in old_manifest if path not in stats]
+    manifest = {path: old_manifest[path] for path in stats if path not in changed}
+    with ThreadPoolExecutor(max_workers=PARSE_WORKERS) as executor:
+        records = executor.map(
+            lambda path: read_metric_file(path, stats[path], old_manifest.get(path)), changed)
+        for path, record in zip(changed, records):
+            # Left out of the manifest, so the next run picks it up again
+            if record is not None:
+                manifest[path] = record
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    affected = set()
+    for path in changed + removed:
+        for record in (old_manifest.get(path), manifest.get(path)):
+            for entry in (record or {}).get("entries", []):
+                affected.add((entry["category"], entry["subcategory"]))
+
+    categories = defaultdict(lambda: defaultdict(list))
+    # Without a manifest the previous output can't be trusted to match the files
+    rebuild_all = previous_output is None or not old_manifest
+    if not rebuild_all:
+        for category, subcategories in previous_output.items():
+            for subcategory, metrics in subcategories.items():
+                if (category, subcategory) not in affected:
+                    categories[category][subcategory] = metrics
+    for path in sorted(manifest):
+        for entry in manifest[path]["entries"]:
+            key = (entry["category"], entry["subcategory"])
+            if rebuild_all or key in affected:
+                categories[key[0]][key[1]].append(entry["metric"])
+    if rebuild_all:
+        affected = {(c, s) for c in categories for s in categories[c]}
+    for category, subcategory in affected:
+        if subcategory in categories.get(category, {}):
+            categories[category][subcategory] = sort_metrics(categories[category][subcategory])
+
+    for category in categories:
+        categories[category] = OrderedDict(
+            sorted(categories[category].items(), key=lambda x: (x[0] == '', x[0]))
+        )
+    categories = dict(sorted((c, s) for c, s in categories.items() if s))
+    timings["sort"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    #with open(os.getcwd() + '/metrics_data.json', 'w') as outfile:
+     #   json.dump(categories, outfile, indent=4)
+    write_json_atomic(metrics_path, categories, indent=4)
+    write_json_atomic(manifest_path, manifest)
+    timings["write"] = time.perf_counter() - start
+
+    print(f"{len(stats)} metric files: {len(changed)} changed, {len(removed)} removed, "
+          f"{len(affected)} subcategories re-sorted")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<6} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
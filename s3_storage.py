@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+import unicodedata
+from urllib.parse import quote
+
+import boto3
+from botocore.config import Config
+
+S3_SECRET_KEY = os.getenv("AWS_SECRET_KEY", None)
+S3_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY", None)
+S3_REGION = "us-east-1"
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "5"))
+S3_PRESIGN_ENABLED = os.getenv("S3_PRESIGN_ENABLED", "true").lower() == "true"
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "300"))
+S3_STREAM_CHUNK_SIZE = 1024 * 1024
+
+_client = None
+_client_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record_call(operation, elapsed_ms, failed):
+    with _stats_lock:
+        stats = _stats.setdefault(
+            operation, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+        )
+        stats["calls"] += 1
+        stats["errors"] += int(failed)
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+
+def _before_call(model, context, **kwargs):
+    context["s3_storage_call"] = (model.name, time.perf_counter())
+
+
+def _after_call(context, parsed=None, exception=None, **kwargs):
+    # after-call-error passes no operation model, hence the name in context
+    call = context.pop("s3_storage_call", None)
+    if call is None:
+        return
+    operation, start = call
+    failed = exception is not None or bool((parsed or {}).get("Error"))
+    _record_call(operation, (time.perf_counter() - start) * 1000, failed)
+
+
+def get_s3_client():
+    """
+    Process-wide S3 client. Built on first use and shared by every thread
+    (boto3 clients are thread-safe), so credentials, endpoints and pooled
+    connections are reused across calls.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                client = boto3.client(
+                    "s3",
+                    aws_access_key_id=S3_ACCESS_KEY,
+                    aws_secret_access_key=S3_SECRET_KEY,
+                    region_name=S3_REGION,
+                    config=Config(
+                        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                        retries={"mode": "adaptive", "max_attempts": S3_MAX_ATTEMPTS},
+                    ),
+                )
+                client.meta.events.register("before-call.s3", _before_call)
+                client.meta.events.register("after-call.s3", _after_call)
+                client.meta.events.register("after-call-error.s3", _after_call)
+                _client = client
+    return _client
+
+
+def get_s3_stats():
+    """Per-operation call counts, error counts and latency (ms) since startup."""
+    with _stats_lock:
+        return {
+            operation: {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 2) if stats["calls"] else 0.0,
+                "max_ms": round(stats["max_ms"], 2),
+            }
+            for operation, stats in _stats.items()
+        }
+
+
+def content_disposition(filename):
+    """
+    Attachment header for `filename`: a plain ASCII `filename` for old
+    clients plus the exact name as an RFC 5987 `filename*`, so quotes and
+    non-ASCII characters can't break the header.
+    """
+    fallback = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+    fallback = "".join(c for c in fallback if c.isprintable() and c not in '"\\') or "download"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def presigned_download_url(bucket, key, filename, content_type=None, expires_in=S3_PRESIGN_EXPIRES):
+    """
+    Short-lived GET URL for an object that makes browsers save it as
+    `filename`. Returns None when presigning is disabled or unavailable
+    (e.g. no credentials to sign with), so callers can fall back to streaming.
+    """
+    if not S3_PRESIGN_ENABLED:
+        return None
+    params = {
+        "Bucket": bucket,
+        "Key": key,
+        "ResponseContentDisposition": content_disposition(filename),
+    }
+    if content_type:
+        params["ResponseContentType"] = content_type
+    try:
+        return get_s3_client().generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=expires_in
+        )
+    except Exception as e:
+        print(f"Error presigning {bucket}/{key}: {e}")
+        return None
+
+
+def stream_object(bucket, key, chunk_size=S3_STREAM_CHUNK_SIZE):
+    """
+    Open an object for streaming. Returns (chunks, content_length,
+    content_type); `chunks` yields the body piece by piece and closes the
+    connection when exhausted.
+    """
+    response = get_s3_client().get_object(Bucket=bucket, Key=key)
+    body = response["Body"]
+
+    def chunks():
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    return chunks(), response.get("ContentLength"), response.get("ContentType")
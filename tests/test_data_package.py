@@ -0,0 +1,83 @@
+import gzip
+import io
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_package  # noqa: E402
+from utils import BooleanData  # noqa: E402
+
+
+class FakeS3:
+    """Just enough of the S3 client for a multipart upload and a put."""
+
+    def __init__(self):
+        self.objects = {}
+        self._parts = {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._parts[Key] = {}
+        return {"UploadId": Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._parts[UploadId][PartNumber] = Body
+        return {"ETag": f'"part-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self._parts.pop(UploadId)
+        self.objects[Key] = b"".join(parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+        return {"ETag": '"complete"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._parts.pop(UploadId, None)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+        return {"ETag": '"put"'}
+
+
+def test_build_data_package_extracts_matching_master_rows(tmp_path, monkeypatch):
+    # Anonymized availability data, with SESSION_IDs rewritten the way
+    # generate_consolidated_data.py does (<subject index>_<session>)
+    static = tmp_path / "static"
+    (static / "anonymized_data").mkdir(parents=True)
+    pd.DataFrame({
+        "SITE": ["ABCD", "ABCD", "EFGH"],
+        "BIDS_ID": ["sub-ABCD0001", "sub-ABCD0002", "sub-EFGH0003"],
+        "SES": ["ses-1", "ses-1", "ses-1"],
+        "SESSION_ID": ["0_1", "1_1", "2_1"],
+        "volume": [1, 0, 1],
+    }).to_csv(static / "anonymized_data" / "anonymized_data.csv", index=False)
+    master = tmp_path / "master.csv"
+    pd.DataFrame({
+        "BIDS_ID": ["sub-ABCD0001", "sub-ABCD0001", "sub-ABCD0002", "sub-EFGH0003"],
+        "SES": ["ses-1", "ses-2", "ses-1", "ses-1"],
+        "volume": [10.5, 11.0, 12.0, 13.5],
+        "age": [30, 31, 40, 50],
+    }).to_csv(master, index=False)
+
+    request_data = {
+        "timepoint": "baseline",
+        "imaging": {"required": [{"metric_name": "volume"}], "optional": []},
+    }
+    s3 = FakeS3()
+    monkeypatch.setattr(BooleanData, "_data", None)
+    monkeypatch.setattr(BooleanData, "_version", None)
+    monkeypatch.setattr(data_package, "get_s3_client", lambda: s3)
+    monkeypatch.setattr(data_package, "get_request_data_from_storage", lambda name: {"data": request_data})
+
+    manifest = data_package.build_data_package(str(static), "request.json", master_path=str(master))
+
+    extract = pd.read_csv(io.BytesIO(gzip.decompress(s3.objects[manifest["object"]])))
+    assert list(extract.columns) == ["BIDS_ID", "SES", "volume"]
+    assert list(zip(extract["BIDS_ID"], extract["SES"])) == [
+        ("sub-ABCD0001", "ses-1"),
+        ("sub-EFGH0003", "ses-1"),
+    ]
+    assert list(extract["volume"]) == [10.5, 13.5]
+    assert manifest["sessions_matched"] == 2
+    assert manifest["rows"] == 2
+    assert manifest["rows_per_site"] == {"ABCD": 1, "EFGH": 1}
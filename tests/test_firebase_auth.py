@@ -0,0 +1,163 @@
+import datetime
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_auth  # noqa: E402
+from google.auth import crypt, jwt  # noqa: E402
+
+x509 = pytest.importorskip("cryptography.x509")
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+
+AUDIENCE = "test-project"
+
+
+def make_key(kid):
+    """A locally generated RSA key: (signer, PEM certificate)."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(x509.oid.NameOID.COMMON_NAME, kid)])
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.datetime(2020, 1, 1))
+        .not_valid_after(datetime.datetime(2100, 1, 1))
+        .sign(key, hashes.SHA256())
+    )
+    pem_key = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    signer = crypt.RSASigner.from_string(pem_key, kid)
+    return signer, cert.public_bytes(serialization.Encoding.PEM).decode("ascii")
+
+
+SIGNER, CERT = make_key("key-1")
+
+
+def sign(claims, signer=SIGNER):
+    now = int(time.time())
+    payload = {"aud": AUDIENCE, "iat": now, "exp": now + 3600}
+    payload.update(claims)
+    return jwt.encode(signer, payload).decode("ascii")
+
+
+class FakeResponse:
+    def __init__(self, certs, max_age):
+        self.status_code = 200
+        self.headers = {"Cache-Control": f"public, max-age={max_age}"}
+        self.content = json.dumps(certs).encode("utf-8")
+
+
+class CertsSession:
+    """Stands in for the pooled requests session serving the certs endpoint."""
+
+    def __init__(self, certs, max_age=120):
+        self.certs = certs
+        self.max_age = max_age
+        self.fetches = 0
+
+    def request(self, method, url, **kwargs):
+        self.fetches += 1
+        return FakeResponse(self.certs, self.max_age)
+
+    def close(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    calls = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args)
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(firebase_auth.jwt, "decode", counting_decode)
+    return calls
+
+
+def make_verifier(session, clock, **kwargs):
+    return firebase_auth.FirebaseTokenVerifier(AUDIENCE, session=session, clock=clock, **kwargs)
+
+
+def test_cache_hit_skips_fetch_and_decode(decodes):
+    session = CertsSession({"key-1": CERT})
+    verifier = make_verifier(session, Clock())
+    token = sign({"email": "a@example.org"})
+
+    assert verifier.verify(token)["email"] == "a@example.org"
+    assert verifier.verify(token)["email"] == "a@example.org"
+    assert session.fetches == 1
+    assert len(decodes) == 1
+
+
+def test_cached_token_expires_at_exp(decodes):
+    clock = Clock()
+    session = CertsSession({"key-1": CERT}, max_age=86400)
+    verifier = make_verifier(session, clock)
+    token = sign({"exp": int(clock.now) + 60})
+
+    verifier.verify(token)
+    clock.now += 59
+    verifier.verify(token)
+    assert len(decodes) == 1
+    clock.now += 1
+    verifier.verify(token)
+    assert len(decodes) == 2
+
+
+def test_certs_kept_for_max_age():
+    clock = Clock()
+    session = CertsSession({"key-1": CERT}, max_age=120)
+    verifier = make_verifier(session, clock)
+
+    verifier.get_certs("key-1")
+    clock.now += 119
+    verifier.get_certs("key-1")
+    assert session.fetches == 1
+    clock.now += 1
+    verifier.get_certs("key-1")
+    assert session.fetches == 2
+
+
+def test_unknown_kid_refetches_at_most_once_per_interval():
+    clock = Clock()
+    session = CertsSession({"key-1": CERT}, max_age=3600)
+    verifier = make_verifier(session, clock, min_refresh_interval=60)
+    verifier.get_certs()
+
+    # A rotated key that isn't published yet, then a bogus one
+    signer, cert = make_key("key-2")
+    token = sign({}, signer=signer)
+    clock.now += 60
+    with pytest.raises(ValueError):
+        verifier.verify(token)
+    for _ in range(20):
+        verifier.get_certs("bogus")
+    assert session.fetches == 2
+
+    # Once the interval has passed, the published key is picked up
+    session.certs = {"key-1": CERT, "key-2": cert}
+    clock.now += 59
+    verifier.get_certs("key-2")
+    assert session.fetches == 2
+    clock.now += 1
+    assert verifier.verify(token)["aud"] == AUDIENCE
+    assert session.fetches == 3
@@ -0,0 +1,149 @@
+import os
+import socketserver
+import sys
+import threading
+from email import message_from_string
+from functools import partial
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mail_queue  # noqa: E402
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP server: accepts plain (no TLS, no auth) sessions and
+    keeps every message it receives. The next `fail_data` DATA commands are
+    answered with a transient 451 error.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.fail_data = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 localhost SMTP stand-in")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode("utf-8")
+            if not line:
+                return
+            command = line.strip().split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                recipients.append(line.strip().split(":", 1)[1].strip("<> "))
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline().decode("utf-8")
+                    if data_line in (".\r\n", ""):
+                        break
+                    lines.append(data_line[1:] if data_line.startswith("..") else data_line)
+                with server.lock:
+                    if server.fail_data > 0:
+                        server.fail_data -= 1
+                        self.reply("451 Temporary failure")
+                        continue
+                    server.messages.append((recipients, message_from_string("".join(lines))))
+                self.reply("250 Queued")
+            elif command == "RSET":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "NOOP":
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_worker(server, **kwargs):
+    connection_factory = partial(
+        mail_queue.SMTPConnection, host="127.0.0.1", port=server.port,
+        username=None, use_tls=False, timeout=5,
+    )
+    kwargs.setdefault("backoff_seconds", 0)
+    return mail_queue.MailWorker(connection_factory=connection_factory, **kwargs)
+
+
+def test_worker_delivers_over_one_session(smtp_server):
+    worker = make_worker(smtp_server)
+    first = worker.enqueue("a@example.org", "Hello", "First body")
+    second = worker.enqueue("b@example.org", "Hi", "Second body", owner="pi@example.org")
+    worker.join()
+    worker.stop()
+
+    assert [recipients for recipients, _ in smtp_server.messages] == [["a@example.org"], ["b@example.org"]]
+    assert [msg["Subject"] for _, msg in smtp_server.messages] == ["Hello", "Hi"]
+    assert smtp_server.connections == 1
+    results = {result["id"]: result for result in worker.results()}
+    assert results[first]["status"] == "sent"
+    assert results[first]["attempts"] == 1
+    assert results[second]["owner"] == "pi@example.org"
+    assert [result["id"] for result in worker.results(owner="PI@example.org")] == [second]
+
+
+def test_worker_retries_transient_failures(smtp_server):
+    smtp_server.fail_data = 1
+    worker = make_worker(smtp_server)
+    job_id = worker.enqueue("a@example.org", "Hello", "Body")
+    worker.join()
+    worker.stop()
+
+    assert len(smtp_server.messages) == 1
+    [result] = worker.results([job_id])
+    assert result["status"] == "sent"
+    assert result["attempts"] == 2
+    # The failed send closed the session, so the retry reconnected
+    assert smtp_server.connections == 2
+
+
+def test_worker_gives_up_after_max_attempts(smtp_server):
+    smtp_server.fail_data = 10
+    worker = make_worker(smtp_server, max_attempts=3)
+    job_id = worker.enqueue("a@example.org", "Hello", "Body")
+    worker.join()
+    worker.stop()
+
+    assert smtp_server.messages == []
+    [result] = worker.results([job_id])
+    assert result["status"] == "failed"
+    assert result["attempts"] == 3
+    assert "Temporary failure" in result["error"]
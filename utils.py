@@ -3,20 +3,30 @@ import numpy as np
 import glob as glob
 import os
 import json
-import boto3
 import csv
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
-import boto3
 from botocore.exceptions import ClientError
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from collections import OrderedDict
 import re
+import bisect
+import base64
+import gzip
 from functools import partial
 from flask import jsonify
 from io import StringIO
+import time
+import random
+import hashlib
+import threading
+from cachetools import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+from s3_storage import get_s3_client
+from mail_queue import SMTPConnection, build_message
+from admin_lists import AdminList
 
 
 class RequestStatus(Enum):
@@ -62,6 +72,12 @@ col_mapping = {
 
 class BooleanData:
     _data = None
+    _version = None
+    # (version, data) swapped as a unit, so readers never pair one with the other's
+    _snapshot = None
+    # Encoded responses, keyed by (version, format)
+    _encoded = {}
+    _encoded_lock = threading.Lock()
     # try:
     #     data = pd.read_csv('static/data/all_data_boolean_subj_with_ses.csv')
     # except:
@@ -69,10 +85,23 @@ class BooleanData:
 
     @classmethod
     def _get_data(cls, path):
-        if cls._data is None:
-            cls._data = pd.read_csv(path + "/anonymized_data/anonymized_data.csv")
+        file_path = path + "/anonymized_data/anonymized_data.csv"
+        stat = os.stat(file_path)
+        version = f"{int(stat.st_mtime)}-{stat.st_size}"
+        if cls._data is None or cls._version != version:
+            data = pd.read_csv(file_path)
+            cls._snapshot = (version, data)
+            cls._data = data
+            cls._version = version
+            with cls._encoded_lock:
+                cls._encoded = {}
         return cls._data
 
+    @classmethod
+    def getVersion(cls, staticPath):
+        cls._get_data(staticPath)
+        return cls._version
+
     @classmethod
     def removeNullRows(cls, cols):
         return cls.data.dropna(subset=cols)
@@ -81,6 +110,29 @@ class BooleanData:
     def getData(cls, staticPath):
         return cls._get_data(staticPath)
 
+    @classmethod
+    def getPayload(cls, staticPath, fmt="records"):
+        """
+        Return (version, gzip-compressed JSON bytes) for the dataset. Each
+        format is serialized once per version; an encode that finishes after
+        the CSV was reloaded is returned but not cached under the new version.
+        """
+        cls._get_data(staticPath)
+        version, data = cls._snapshot
+        with cls._encoded_lock:
+            body = cls._encoded.get((version, fmt))
+        if body is not None:
+            return version, body
+        if fmt == "columnar":
+            text = json.dumps(_encode_boolean_data_columnar(data), separators=(",", ":"))
+        else:
+            text = data.to_json(orient="records")
+        body = gzip.compress(text.encode("utf-8"))
+        with cls._encoded_lock:
+            if cls._snapshot[0] == version:
+                cls._encoded[(version, fmt)] = body
+        return version, body
+
     @classmethod
     def applyFiltersAndGetCount(cls, staticPath, required_cols, session="baseline", or_groups=None):
         try:
@@ -128,10 +180,422 @@ class BooleanData:
             print("Error filtering rows:", e)
             return pd.DataFrame([])
 
+BOOLEAN_DATA_ID_COLUMNS = ["SESSION_ID", "SITE", "BIDS_ID", "SES"]
+
+
+def _encode_codes(values):
+    codes, uniques = pd.factorize(values, sort=True)
+    encoded = base64.b64encode(codes.astype("<i4").tobytes()).decode("ascii")
+    return [str(value) for value in uniques], encoded
+
+
+def _is_binary_column(values):
+    """True when every non-missing value is 0 or 1, so a bit vector loses nothing."""
+    present = values.dropna()
+    return bool(present.isin([0, 1]).all())
+
+
+def _encode_boolean_data_columnar(data):
+    """
+    Columnar layout of the boolean dataset: site, session and subject are
+    dictionary-encoded as little-endian int32 codes (-1 for missing; null
+    when the column is absent) and every 0/1 availability column is a base64
+    bit vector (np.packbits, little bit order) with a 1 where the metric is
+    available for that row. Columns holding anything other than 0/1/NaN are
+    sent as plain value lists under `values`.
+    """
+    encoded_ids = {}
+    for name, col in (("site", "SITE"), ("session", "SES"), ("subject", "BIDS_ID")):
+        encoded_ids[name] = _encode_codes(data[col]) if col in data.columns else (None, None)
+    sites, site_codes = encoded_ids["site"]
+    sessions, session_codes = encoded_ids["session"]
+    subjects, subject_codes = encoded_ids["subject"]
+    columns = [col for col in data.columns if col not in BOOLEAN_DATA_ID_COLUMNS]
+    bits = {}
+    values = {}
+    for col in columns:
+        if _is_binary_column(data[col]):
+            packed = np.packbits(data[col].eq(1).to_numpy(), bitorder="little")
+            bits[col] = base64.b64encode(packed.tobytes()).decode("ascii")
+        else:
+            values[col] = [None if pd.isna(value) else value for value in data[col].tolist()]
+    return {
+        "format": "columnar",
+        "rows": len(data),
+        "columns": columns,
+        "sites": sites,
+        "site_codes": site_codes,
+        "sessions": sessions,
+        "session_codes": session_codes,
+        "subject_count": len(subjects) if subjects is not None else None,
+        "subject_codes": subject_codes,
+        "bits": bits,
+        "values": values,
+    }
+
+
+BOOLEAN_DATA_PAGE_SIZE = 1000
+BOOLEAN_DATA_MAX_PAGE_SIZE = 10000
+BOOLEAN_DATA_STREAM_BATCH = 500
+
+
+def _page_query_hash(columns, sites, sessions):
+    """Fingerprint of the projection and filters a cursor was issued for."""
+    query = {"columns": columns, "sites": sites, "sessions": sessions}
+    return hashlib.sha256(json.dumps(query, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _encode_cursor(version, offset, query_hash):
+    raw = json.dumps({"v": version, "o": offset, "q": query_hash}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        version, offset, query_hash = decoded["v"], int(decoded["o"]), decoded["q"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return version, offset, query_hash
+
+
+def get_boolean_data_page(staticPath, columns=None, sites=None, sessions=None, cursor=None, limit=None):
+    """
+    Project and filter the boolean dataset and return one page of it as a
+    stream of JSON chunks. The cursor encodes the dataset version, the row
+    offset and a hash of the columns/sites/sessions it was issued for, so a
+    cursor from an older dataset or another query is rejected instead of
+    skipping or repeating rows.
+    """
+    data = BooleanData.getData(staticPath)
+    version = BooleanData.getVersion(staticPath)
+    query_hash = _page_query_hash(columns, sites, sessions)
+
+    if columns:
+        unknown = [col for col in columns if col not in data.columns]
+        if unknown:
+            return {"success": False, "status": 400, "message": f"Unknown columns: {', '.join(unknown)}"}
+    else:
+        columns = list(data.columns)
+
+    offset = 0
+    if cursor:
+        try:
+            cursor_version, offset, cursor_query_hash = _decode_cursor(cursor)
+        except ValueError as e:
+            return {"success": False, "status": 400, "message": str(e)}
+        if cursor_query_hash != query_hash:
+            return {"success": False, "status": 400, "message": "Cursor belongs to a different query"}
+        if cursor_version != version:
+            return {"success": False, "status": 409, "message": "Dataset changed, restart pagination"}
+
+    if limit is not None or cursor:
+        limit = min(max(int(limit or BOOLEAN_DATA_PAGE_SIZE), 1), BOOLEAN_DATA_MAX_PAGE_SIZE)
+
+    for values, col in ((sites, "SITE"), (sessions, "SES")):
+        if values and col not in data.columns:
+            return {"success": False, "status": 400, "message": f"Dataset has no {col} column to filter on"}
+
+    mask = np.ones(len(data), dtype=bool)
+    if sites:
+        mask &= data["SITE"].isin(sites).to_numpy()
+    if sessions:
+        mask &= data["SES"].isin(sessions).to_numpy()
+    positions = np.flatnonzero(mask)
+    total = len(positions)
+    end = total if limit is None else min(offset + limit, total)
+    page = data.iloc[positions[offset:end]][columns]
+    next_cursor = _encode_cursor(version, end, query_hash) if end < total else None
+
+    def generate():
+        yield '{"version":' + json.dumps(version)
+        yield ',"total":' + str(total)
+        yield ',"columns":' + json.dumps(columns)
+        yield ',"rows":['
+        first = True
+        for start in range(0, len(page), BOOLEAN_DATA_STREAM_BATCH):
+            rows = page.iloc[start:start + BOOLEAN_DATA_STREAM_BATCH].to_json(orient="records")[1:-1]
+            if rows:
+                yield rows if first else "," + rows
+                first = False
+        yield '],"next_cursor":' + json.dumps(next_cursor) + "}"
+
+    return {"success": True, "stream": generate()}
+
+
 def get_boolean_data_from_file(staticPath):
     return BooleanData.getData(staticPath).to_json(orient="records")
 
 
+class MetricsCatalog:
+    """
+    metrics_data.json split into behavioral and imaging sections, parsed and
+    serialized once per file version rather than on every /metrics call.
+    """
+    _data = None
+    _version = None
+    _json = None
+    _encoded = None
+
+    @classmethod
+    def _get_data(cls, staticPath):
+        file_path = staticPath + "/anonymized_data/metrics_data.json"
+        stat = os.stat(file_path)
+        version = f"{int(stat.st_mtime)}-{stat.st_size}"
+        if cls._data is None or cls._version != version:
+            with open(file_path, "r") as file:
+                all_metrics = json.loads(file.read())
+            behavioral_data = {}
+            imaging_data = {}
+            for category, subcategories in all_metrics.items():
+                if category == 'Modality':
+                    continue
+                if (
+                    category.startswith(('Imaging', 'Image')) or
+                    category in ['Lesion Information']
+                ):
+                    imaging_data[category] = subcategories
+                else:
+                    behavioral_data[category] = subcategories
+            cls._data = {
+                "behavioral": behavioral_data,
+                "imaging": imaging_data
+            }
+            cls._version = version
+            cls._json = None
+            cls._encoded = None
+        return cls._data
+
+    @classmethod
+    def getData(cls, staticPath):
+        return cls._get_data(staticPath)
+
+    @classmethod
+    def getPayload(cls, staticPath, fmt="records"):
+        """
+        Return (version, gzip-compressed JSON bytes) for the dataset. Each
+        format is serialized once per version; an encode that finishes after
+        the CSV was reloaded is returned but not cached under the new version.
+        """
+        cls._get_data(staticPath)
+        version, data = cls._snapshot
+        with cls._encoded_lock:
+            body = cls._encoded.get((version, fmt))
+        if body is not None:
+            return version, body
+        if fmt == "columnar":
+            text = json.dumps(_encode_boolean_data_columnar(data), separators=(",", ":"))
+        else:
+            text = data.to_json(orient="records")
+        body = gzip.compress(text.encode("utf-8"))
+        with cls._encoded_lock:
+            if cls._snapshot[0] == version:
+                cls._encoded[(version, fmt)] = body
+        return version, body
+
+    @classmethod
+    def getVersion(cls, staticPath):
+        cls._get_data(staticPath)
+        return cls._version
+
+    @classmethod
+    def getJson(cls, staticPath):
+        """Return (version, JSON text) of the catalog, for embedding in larger payloads."""
+        data = cls._get_data(staticPath)
+        version, text = cls._version, cls._json
+        if text is None:
+            text = json.dumps(data, sort_keys=True)
+            cls._json = text
+        return version, text
+
+    @classmethod
+    def getPayload(cls, staticPath):
+        """Return (version, gzip-compressed JSON bytes) of the catalog."""
+        version, text = cls.getJson(staticPath)
+        if cls._encoded is None:
+            cls._encoded = gzip.compress(text.encode("utf-8"))
+        return version, cls._encoded
+
+
+METRIC_SEARCH_MAX_LIMIT = 100
+# How long a search trusts the index before re-checking its source files
+METRIC_SEARCH_REVALIDATE_SECONDS = float(os.getenv("METRIC_SEARCH_REVALIDATE_SECONDS", "5"))
+
+
+class MetricSearchIndex:
+    """
+    In-memory search index over metrics_data.json, rebuilt when the metrics
+    file or the boolean availability data changes (checked at most every
+    METRIC_SEARCH_REVALIDATE_SECONDS). Tokens of every searchable field go
+    into an inverted index (token -> {metric position: field weight}); a
+    trigram index over the token vocabulary resolves fragments typed from
+    the middle of a word.
+    """
+    _FIELD_WEIGHTS = {
+        "metric_name": 5.0,
+        "name": 4.0,
+        "subcategory": 2.0,
+        "category": 1.5,
+        "description": 1.0,
+    }
+    _EXACT, _PREFIX, _SUBSTRING = 1.0, 0.8, 0.5
+    # (metrics, postings, vocabulary, trigrams) of one build, so a search
+    # running during a rebuild never mixes two builds
+    _index = None
+    _version = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _tokenize(text):
+        return re.findall(r"[a-z0-9]+", str(text or "").lower())
+
+    @staticmethod
+    def _get_trigrams(token):
+        return {token[i:i + 3] for i in range(len(token) - 2)}
+
+    @classmethod
+    def _get_availability_counts(cls, staticPath):
+        try:
+            data = BooleanData.getData(staticPath)
+        except FileNotFoundError:
+            return {}
+        return data.eq(1).sum().to_dict()
+
+    @classmethod
+    def _get_source_version(cls, staticPath):
+        try:
+            data_version = BooleanData.getVersion(staticPath)
+        except FileNotFoundError:
+            data_version = None
+        return (MetricsCatalog.getVersion(staticPath), data_version)
+
+    @classmethod
+    def _build(cls, staticPath):
+        with open(staticPath + "/anonymized_data/metrics_data.json", "r") as file:
+            all_metrics = json.loads(file.read())
+        counts = cls._get_availability_counts(staticPath)
+
+        metrics = []
+        postings = {}
+        for category, subcategories in all_metrics.items():
+            if category == "Modality":
+                continue
+            if not isinstance(subcategories, dict):
+                subcategories = {"": subcategories}
+            for subcategory, metric_list in subcategories.items():
+                for metric in metric_list:
+                    position = len(metrics)
+                    metrics.append({
+                        "metric_name": metric["metric_name"],
+                        "name": metric.get("name", metric["metric_name"]),
+                        "description": metric.get("description", ""),
+                        "variable_type": metric.get("variable_type"),
+                        "category": category,
+                        "subcategory": subcategory,
+                        "count": int(counts.get(metric["metric_name"], 0)),
+                    })
+                    for field, weight in cls._FIELD_WEIGHTS.items():
+                        for token in cls._tokenize(metrics[-1][field]):
+                            weights = postings.setdefault(token, {})
+                            weights[position] = max(weights.get(position, 0), weight)
+
+        trigrams = {}
+        for token in postings:
+            for trigram in cls._get_trigrams(token):
+                trigrams.setdefault(trigram, set()).add(token)
+
+        return (metrics, postings, sorted(postings), trigrams)
+
+    @classmethod
+    def _is_fresh(cls):
+        return cls._index is not None and time.monotonic() - cls._checked_at < METRIC_SEARCH_REVALIDATE_SECONDS
+
+    @classmethod
+    def _get_index(cls, staticPath):
+        if cls._is_fresh():
+            return cls._index
+        with cls._lock:
+            if cls._is_fresh():
+                return cls._index
+            version = cls._get_source_version(staticPath)
+            if cls._index is None or cls._version != version:
+                cls._index = cls._build(staticPath)
+                cls._version = version
+            cls._checked_at = time.monotonic()
+            return cls._index
+
+    @classmethod
+    def _match_token(cls, query_token, vocabulary, trigrams):
+        """Return {vocabulary token: match quality} for a single query token."""
+        matches = {}
+        start = bisect.bisect_left(vocabulary, query_token)
+        for token in vocabulary[start:]:
+            if not token.startswith(query_token):
+                break
+            matches[token] = cls._EXACT if token == query_token else cls._PREFIX
+
+        if len(query_token) >= 3:
+            candidates = None
+            for trigram in cls._get_trigrams(query_token):
+                tokens = trigrams.get(trigram, set())
+                candidates = tokens if candidates is None else candidates & tokens
+                if not candidates:
+                    break
+            for token in candidates or ():
+                if token not in matches and query_token in token:
+                    matches[token] = cls._SUBSTRING
+        return matches
+
+    @classmethod
+    def search(cls, staticPath, query, limit=20):
+        metrics, postings, vocabulary, trigrams = cls._get_index(staticPath)
+        limit = min(max(int(limit), 0), METRIC_SEARCH_MAX_LIMIT)
+        query_tokens = list(dict.fromkeys(cls._tokenize(query)))
+        if not query_tokens:
+            return []
+
+        scores = None
+        for query_token in query_tokens:
+            token_scores = {}
+            for token, quality in cls._match_token(query_token, vocabulary, trigrams).items():
+                for position, weight in postings[token].items():
+                    score = weight * quality
+                    if score > token_scores.get(position, 0):
+                        token_scores[position] = score
+            # Every query token has to match somewhere in the metric
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    position: score + token_scores[position]
+                    for position, score in scores.items()
+                    if position in token_scores
+                }
+            if not scores:
+                return []
+
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (-item[1], metrics[item[0]]["name"].lower()),
+        )
+        return [
+            dict(metrics[position], score=round(score, 3))
+            for position, score in ranked[:limit]
+        ]
+
+
+def search_metrics(staticPath, query, limit=20):
+    try:
+        results = MetricSearchIndex.search(staticPath, query, limit)
+        return {"success": True, "results": results}
+    except Exception as e:
+        print("Error in search_metrics:", e)
+        return {"success": False, "message": str(e)}
+
+
 def get_data(behavior_filters):
     cols_of_interest = set(["BIDS_ID", "SES", "AGE", "SEX"])
     for key in behavior_filters.keys():
@@ -409,6 +873,89 @@ def get_filtered_rows_count(staticPath, filters):
     except Exception as e:
         print("Error in get_filtered_rows_count:", e)
         return {"success": False, "message": str(e)}
+
+def canonical_request_filters(filters):
+    """Order-independent form of a rows-count filter, so equivalent filters compare equal."""
+    return {
+        "timepoint": filters.get("timepoint") or "baseline",
+        "required_metrics": sorted(set(filters.get("required_metrics") or [])),
+        "or_groups": sorted(sorted(set(group)) for group in filters.get("or_groups") or []),
+    }
+
+
+def evaluate_filters_batch(staticPath, filters_list):
+    """
+    get_filtered_rows_count for many filters at once. Column masks and
+    session masks are computed once per batch, so each filter costs a few
+    vectorised ANDs over the already-loaded data instead of a copy of it.
+    """
+    data = BooleanData.getData(staticPath)
+    empty_result = {"success": True, "count": 0, "total_sites": 0, "sessions_per_site": {}}
+    if data is None or data.empty:
+        return [dict(empty_result) for _ in filters_list]
+
+    column_masks = {}
+
+    def masks(col):
+        # (not null, equals 1, truthy) for one column
+        if col not in column_masks:
+            values = data[col]
+            present = values.notna()
+            column_masks[col] = (
+                present.to_numpy(), values.eq(1).to_numpy(), (present & values.ne(0)).to_numpy()
+            )
+        return column_masks[col]
+
+    ses = data["SES"].astype(str)
+    baseline_mask = ses.eq("ses-1").to_numpy()
+    session_mask = ses.str.startswith("ses-").to_numpy()
+    all_rows = np.ones(len(data), dtype=bool)
+
+    results = []
+    for filters in filters_list:
+        required = filters.get("required_metrics", [])
+        or_groups = filters.get("or_groups", [])
+        relevant = list(required) + [col for group in or_groups for col in group]
+        if any(col not in data.columns for col in relevant):
+            # The single-filter path fails on unknown columns and reports no rows
+            results.append(dict(empty_result))
+            continue
+        mask = all_rows.copy()
+        for col in relevant:
+            mask &= masks(col)[0]
+        for col in required:
+            mask &= masks(col)[1]
+        for group in or_groups:
+            if group:
+                group_mask = np.zeros(len(data), dtype=bool)
+                for col in group:
+                    group_mask |= masks(col)[2]
+                mask &= group_mask
+
+        if filters.get("timepoint", "baseline") == "baseline":
+            mask &= baseline_mask
+            filtered = data.loc[mask]
+        else:
+            filtered = data.loc[mask & session_mask]
+            sessions = filtered.groupby("BIDS_ID")["SES"].nunique()
+            filtered = filtered[filtered["BIDS_ID"].isin(sessions[sessions.ge(2)].index)]
+
+        if filtered.empty:
+            results.append(dict(empty_result))
+            continue
+        sessions_per_site = {}
+        if "SITE" in filtered.columns:
+            sessions_per_site = {
+                site: int(count) for site, count in sorted(filtered.groupby("SITE").size().items())
+            }
+        results.append({
+            "success": True,
+            "count": len(filtered),
+            "total_sites": int(filtered["SITE"].nunique()) if "SITE" in filtered.columns else 0,
+            "sessions_per_site": sessions_per_site,
+        })
+    return results
+
 '''
 def send_email(recipient):
     smtp_server = "email-smtp.us-east-1.amazonaws.com"
@@ -438,28 +985,18 @@ def send_email(recipient):
         return False
 '''
 def send_email(recipient, subject=None, body=None):
-    smtp_server = "email-smtp.us-east-1.amazonaws.com"
-    port = 587
-    sender = "npnlusc@gmail.com"
-
+    """Send one email synchronously; request handlers should use enqueue_email."""
     subject = subject or "NPNL Data Request Notification"
     body = body or "A new data request has been submitted."
 
-    msg = MIMEMultipart()
-    msg["From"] = sender
-    msg["To"] = recipient
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
-
+    connection = SMTPConnection()
     try:
-        server = smtplib.SMTP(smtp_server, port, timeout=10)
-        server.starttls()
-        server.login(SMTP_USERNAME, SMTP_PASSWORD)
-        server.sendmail(sender, recipient, msg.as_string())
-        server.quit()
+        connection.send(build_message(recipient, subject, body))
         return True
     except Exception:
         return False
+    finally:
+        connection.close()
 
 def upload_file_to_s3(file_name, content, object_name=None):
     # If S3 object_name was not specified, use file_name
@@ -467,12 +1004,7 @@ def upload_file_to_s3(file_name, content, object_name=None):
         object_name = file_name
 
     # Upload the file
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=PROD_ACCESS_KEY,
-        aws_secret_access_key=PROD_SECRET_KEY,
-        region_name="us-east-1",
-    )
+    s3_client = get_s3_client()
 
     try:
         response2 = s3_client.put_object(
@@ -484,8 +1016,40 @@ def upload_file_to_s3(file_name, content, object_name=None):
         return False, str(e)
 
 
-def add_data_request(data):
+REQUEST_DEDUP_WINDOW_HOURS = float(os.getenv("REQUEST_DEDUP_WINDOW_HOURS", "24"))
+
+
+def _find_duplicate_request(index, content_hash):
+    """The index entry of an identical request from the same requestor within the dedup window."""
+    if REQUEST_DEDUP_WINDOW_HOURS <= 0:
+        return None
+    cutoff = (datetime.now() - timedelta(hours=REQUEST_DEDUP_WINDOW_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+    matches = [
+        entry for entry in index["requests"].values()
+        if entry.get("request_hash") == content_hash
+        and entry["time"] >= cutoff
+        and (entry.get("status") or "").lower() != RequestStatus.FAILED.value
+    ]
+    return max(matches, key=lambda entry: entry["time"]) if matches else None
+
+
+def add_data_request(data, staticPath=None):
     try:
+        try:
+            index, _ = _read_request_index(get_s3_client())
+            duplicate = _find_duplicate_request(index, request_hash(data["requestor"]["email"], data))
+        except Exception as e:
+            # Dedup is best-effort; never block a submission on it
+            print(f"Error checking for duplicate requests: {e}")
+            duplicate = None
+        if duplicate is not None:
+            return {
+                "success": True,
+                "message": "An identical request was already submitted",
+                "filename": duplicate["file_name"],
+                "duplicate": True,
+            }
+
         requestor = data["requestor"]["name"]
         currentTime = datetime.now().strftime("%Y%m%d%H%M%S")
         fileName = f"{requestor}_{currentTime}.json"
@@ -500,70 +1064,680 @@ def add_data_request(data):
         json_string = json.dumps(dataRequest).encode("utf-8")
 
         success, message = upload_file_to_s3(fileName, json_string)
-        return {"success": success, "message": message, "filename": fileName}
+        if not success:
+            return {"success": success, "message": message, "filename": fileName, "duplicate": False}
+
+        # Checked again inside the conditional index update, so of two
+        # concurrent identical submissions the retried one sees the other's entry
+        duplicate = {}
+        try:
+            entry = _request_index_entry(fileName, dataRequest)
+
+            def add_entry(index):
+                duplicate.clear()
+                found = _find_duplicate_request(index, entry["request_hash"])
+                if found is not None:
+                    duplicate.update(found)
+                    return False
+                index["requests"][fileName] = entry
+
+            update_request_index(add_entry)
+        except Exception as e:
+            # The request itself is stored; rebuild-request-index recovers the entry
+            print(f"Error updating request index for {fileName}: {e}")
+            duplicate.clear()
+        if duplicate:
+            if duplicate["file_name"] == fileName:
+                # Same requestor within the same second: the upload replaced it in place
+                return {"success": True, "message": message, "filename": fileName, "duplicate": True}
+            try:
+                get_s3_client().delete_object(Bucket=BUCKET_NAME, Key=REQUESTS_PREFIX + fileName)
+            except Exception as e:
+                print(f"Error removing duplicate request {fileName}: {e}")
+            return {
+                "success": True,
+                "message": "An identical request was already submitted",
+                "filename": duplicate["file_name"],
+                "duplicate": True,
+            }
+
+        try:
+            contribution = _request_analytics_contribution(dataRequest, staticPath, file_name=fileName)
+            update_request_analytics(partial(_add_analytics_contribution, contribution=contribution))
+        except Exception as e:
+            print(f"Error updating request analytics for {fileName}: {e}")
+        return {"success": success, "message": message, "filename": fileName, "duplicate": False}
     except Exception as e:
         print(e)
         return {"success": False, "message": str(e.args[0])}
 
 
-def get_requests():
-    PREFIX_DIR = "data-requests/"
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=PROD_ACCESS_KEY,
-        aws_secret_access_key=PROD_SECRET_KEY,
-        region_name="us-east-1",
-    )
-    response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=PREFIX_DIR)
-    files = [
-        file["Key"]
-        for file in response.get("Contents", [])
-        if file["Key"].endswith(".json")
-    ]
-    file_data = []
-    for file_key in files:
-        file_content = s3_client.get_object(Bucket=BUCKET_NAME, Key=file_key)
-        file_name = file_key.split(PREFIX_DIR)[1]
-        file_text = file_content["Body"].read().decode("utf-8")
-        file_json = json.loads(file_text)
-
-        file_data.append(
-            {
-                "file_name": file_name,
-                "time": file_json["timestamp"],
-                "name": file_json["requestor"]["name"],
-                "email": file_json["requestor"]["email"],
-                "data": file_json["request"],
-                "status": (
-                    file_json["status"] if "status" in file_json else "pending"
-                ).capitalize(),
-            }
-        )
-    return file_data
+REQUESTS_PREFIX = "data-requests/"
+REQUESTS_FETCH_WORKERS = int(os.getenv("REQUESTS_FETCH_WORKERS", "16"))
 
 
-def get_request_data_from_storage(filename):
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=PROD_ACCESS_KEY,
-        aws_secret_access_key=PROD_SECRET_KEY,
-        region_name="us-east-1",
-    )
-    response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix="data-requests/")
-    file_key = f"data-requests/{filename}"
-    response = s3_client.get_object(Bucket=BUCKET_NAME, Key=file_key)
-    file_content = response["Body"].read().decode("utf-8")
-    file_content = json.loads(file_content)
-    data = {
-        "file_name": filename,
-        "time": file_content["timestamp"],
-        "name": file_content["requestor"]["name"],
-        "email": file_content["requestor"]["email"],
-        "data": file_content["request"],
+def _format_request(file_name, file_json):
+    return {
+        "file_name": file_name,
+        "time": file_json["timestamp"],
+        "name": file_json["requestor"]["name"],
+        "email": file_json["requestor"]["email"],
+        "data": file_json["request"],
         "status": (
-            file_content["status"] if "status" in file_content else "pending"
+            file_json["status"] if "status" in file_json else "pending"
         ).capitalize(),
     }
+
+
+def request_filters(request_data):
+    """The /rows-count filters equivalent to a submitted request (as built by the request summary page)."""
+    behavior = request_data.get("behavior") or {}
+    imaging = request_data.get("imaging") or {}
+    required = (behavior.get("required") or []) + (imaging.get("required") or [])
+    return {
+        "timepoint": request_data.get("timepoint") or "baseline",
+        "required_metrics": [m["metric_name"] for m in required],
+        "or_groups": [
+            [m["metric_name"] for m in group.get("metrics", [])]
+            for group in request_data.get("or_groups") or []
+        ],
+    }
+
+
+def request_metric_names(request_data):
+    """Every metric a request asks for, required, optional or in an OR group."""
+    names = set()
+    for section in ("behavior", "imaging"):
+        for kind in ("required", "optional"):
+            names.update(m["metric_name"] for m in (request_data.get(section) or {}).get(kind) or [])
+    for group in request_data.get("or_groups") or []:
+        names.update(m["metric_name"] for m in group.get("metrics", []))
+    return names
+
+
+def request_hash(email, request_data):
+    """
+    Content hash of what a request asks for: the requestor's email plus the
+    timepoint and the order-independent metric selection. Notes are left out,
+    so a resubmission with a reworded note still counts as a duplicate.
+    """
+    def names(entries):
+        return sorted({m["metric_name"] for m in entries or []})
+
+    behavior = request_data.get("behavior") or {}
+    imaging = request_data.get("imaging") or {}
+    canonical = {
+        "email": (email or "").strip().lower(),
+        "timepoint": request_data.get("timepoint") or "baseline",
+        "behavior": {"required": names(behavior.get("required")), "optional": names(behavior.get("optional"))},
+        "imaging": {"required": names(imaging.get("required")), "optional": names(imaging.get("optional"))},
+        "or_groups": sorted(names(group.get("metrics")) for group in request_data.get("or_groups") or []),
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# Read-through cache of request documents: S3 key -> (etag, JSON text, checked_at).
+# Entries younger than REQUEST_CACHE_TTL seconds are served without touching
+# S3; older ones are revalidated with a conditional GET on the stored ETag.
+# The text is parsed on every read, so callers get a document they can modify.
+REQUEST_CACHE_SIZE = int(os.getenv("REQUEST_CACHE_SIZE", "1024"))
+REQUEST_CACHE_TTL = float(os.getenv("REQUEST_CACHE_TTL", "30"))
+REQUEST_CACHE_DIR = os.getenv("REQUEST_CACHE_DIR")
+_request_cache = LRUCache(maxsize=REQUEST_CACHE_SIZE)
+_request_cache_lock = threading.Lock()
+
+
+def _request_cache_path(key):
+    return os.path.join(REQUEST_CACHE_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+
+def _read_request_cache(key):
+    with _request_cache_lock:
+        cached = _request_cache.get(key)
+    if cached is not None or not REQUEST_CACHE_DIR:
+        return cached
+    try:
+        with open(_request_cache_path(key), "r") as f:
+            stored = json.load(f)
+        # Disk entries always get revalidated before use
+        return stored["etag"], stored["body"], 0.0
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def _write_request_cache(key, etag, body):
+    with _request_cache_lock:
+        _request_cache[key] = (etag, body, time.monotonic())
+    if REQUEST_CACHE_DIR:
+        try:
+            os.makedirs(REQUEST_CACHE_DIR, exist_ok=True)
+            path = _request_cache_path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"etag": etag, "body": body}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing request cache for {key}: {e}")
+
+
+def _get_request_document(s3_client, key):
+    """Return the parsed request JSON stored at `key`, using the cache when valid."""
+    cached = _read_request_cache(key)
+    if cached is not None:
+        etag, body, checked_at = cached
+        if time.monotonic() - checked_at < REQUEST_CACHE_TTL:
+            return json.loads(body)
+        try:
+            response = s3_client.get_object(Bucket=BUCKET_NAME, Key=key, IfNoneMatch=etag)
+        except ClientError as e:
+            if e.response["ResponseMetadata"]["HTTPStatusCode"] != 304:
+                raise
+            _write_request_cache(key, etag, body)
+            return json.loads(body)
+    else:
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
+    body = response["Body"].read().decode("utf-8")
+    _write_request_cache(key, response["ETag"], body)
+    return json.loads(body)
+
+
+def _fetch_request(s3_client, file_key):
+    """Fetch and format one stored request; returns None if it can't be read."""
+    try:
+        file_name = file_key.split(REQUESTS_PREFIX)[1]
+        return _format_request(file_name, _get_request_document(s3_client, file_key))
+    except Exception as e:
+        print(f"Error reading request {file_key}: {e}")
+        return None
+
+
+def _fetch_request_document(s3_client, file_key):
+    """The stored request JSON, or None if it can't be read."""
+    try:
+        return _get_request_document(s3_client, file_key)
+    except Exception as e:
+        print(f"Error reading request {file_key}: {e}")
+        return None
+
+
+def _list_request_keys(s3_client):
+    """All stored request keys, following continuation tokens past 1000 keys."""
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=REQUESTS_PREFIX):
+        for file in page.get("Contents", []):
+            key = file["Key"]
+            # Underscore-prefixed objects (the index) are metadata, not requests
+            if key.endswith(".json") and not key[len(REQUESTS_PREFIX):].startswith("_"):
+                keys.append(key)
+    return keys
+
+
+def _fetch_requests(s3_client, keys):
+    with ThreadPoolExecutor(max_workers=REQUESTS_FETCH_WORKERS) as executor:
+        results = executor.map(partial(_fetch_request, s3_client), keys)
+        return [result for result in results if result is not None]
+
+
+# Request index: summary fields of every stored request in a single object,
+# so the admin listing doesn't have to read every request body.
+REQUEST_INDEX_KEY = REQUESTS_PREFIX + "_index.json"
+REQUEST_INDEX_MAX_RETRIES = 8
+# Margin for clock differences between instances when a rebuild decides which
+# unlisted index entries were submitted while it ran
+REQUEST_REBUILD_CLOCK_SKEW = int(os.getenv("REQUEST_REBUILD_CLOCK_SKEW", "300"))
+REQUEST_INDEX_FIELDS = ["file_name", "time", "name", "email", "status"]
+CONDITIONAL_WRITE_CONFLICTS = ("PreconditionFailed", "ConditionalRequestConflict")
+
+
+def _index_entry(formatted_request):
+    entry = {field: formatted_request[field] for field in REQUEST_INDEX_FIELDS}
+    entry["request_hash"] = request_hash(formatted_request["email"], formatted_request["data"])
+    return entry
+
+
+def _request_index_entry(file_name, data_request):
+    return _index_entry(_format_request(file_name, data_request))
+
+
+def _read_json_object(s3_client, key, default):
+    """Return (document, etag); etag is None when the object doesn't exist yet."""
+    try:
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return default(), None
+    document = json.loads(response["Body"].read().decode("utf-8"))
+    return document, response["ETag"]
+
+
+def _write_json_object(s3_client, key, document, etag):
+    """Write the object only if it is unchanged since it was read at `etag`."""
+    precondition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    response = s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        Body=json.dumps(document).encode("utf-8"),
+        ContentType="application/json",
+        **precondition,
+    )
+    return response["ETag"]
+
+
+def _update_json_object(key, default, mutate):
+    """
+    Apply `mutate(document)` to the latest version of a JSON object and write
+    it back with a conditional put, re-reading and re-applying on conflict so
+    concurrent writers don't overwrite each other. A `mutate` that returns
+    False left the document unchanged, and nothing is written.
+    """
+    s3_client = get_s3_client()
+    for attempt in range(REQUEST_INDEX_MAX_RETRIES):
+        document, etag = _read_json_object(s3_client, key, default)
+        if mutate(document) is False:
+            return document
+        try:
+            _write_json_object(s3_client, key, document, etag)
+            return document
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in CONDITIONAL_WRITE_CONFLICTS:
+                raise
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+    raise RuntimeError(f"Update of {key} conflicted too many times")
+
+
+def _empty_request_index():
+    return {"version": 1, "requests": {}}
+
+
+def _read_request_index(s3_client):
+    return _read_json_object(s3_client, REQUEST_INDEX_KEY, _empty_request_index)
+
+
+def update_request_index(mutate):
+    """Apply `mutate(index)` to the request index with a conditional write."""
+    return _update_json_object(REQUEST_INDEX_KEY, _empty_request_index, mutate)
+
+
+def rebuild_request_index():
+    """
+    Regenerate the request index from every request object in the bucket.
+    Entries already in the index that the listing missed and that are newer
+    than the rebuild (submitted while it ran) are kept; older ones are
+    dropped as stale.
+    """
+    s3_client = get_s3_client()
+    started = (datetime.now() - timedelta(seconds=REQUEST_REBUILD_CLOCK_SKEW)).strftime("%Y-%m-%d %H:%M:%S")
+    requests = _fetch_requests(s3_client, _list_request_keys(s3_client))
+    entries = {}
+    for request in requests:
+        # A malformed request shouldn't abort the whole rebuild
+        try:
+            entries[request["file_name"]] = _index_entry(request)
+        except Exception as e:
+            print(f"Skipping {request['file_name']} in request index: {e!r}")
+
+    def replace_entries(index):
+        submitted = {
+            file_name: entry for file_name, entry in index["requests"].items()
+            if file_name not in entries and entry.get("time", "") >= started
+        }
+        index["requests"] = {**entries, **submitted}
+
+    return update_request_index(replace_entries)
+
+
+REQUESTS_MAX_PAGE_SIZE = 200
+
+
+def _encode_request_cursor(entry):
+    raw = json.dumps([entry["time"], entry["file_name"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_request_cursor(cursor):
+    try:
+        time_value, file_name = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(time_value), str(file_name)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _read_request_entries():
+    s3_client = get_s3_client()
+    index, etag = _read_request_index(s3_client)
+    if etag is None:
+        index = rebuild_request_index()
+    return list(index["requests"].values())
+
+
+def list_requests(page_size=None, cursor=None, status=None, requester=None,
+                  date_from=None, date_to=None, descending=True):
+    """
+    Filter, sort (by timestamp, then file name) and page the request index.
+    The cursor is the sort key of the last entry returned, so pages stay
+    stable while new requests are being submitted.
+    """
+    for value in (date_from, date_to):
+        if value:
+            datetime.strptime(value, "%Y-%m-%d")
+    entries = _read_request_entries()
+
+    if status:
+        status = status.lower()
+        entries = [e for e in entries if (e.get("status") or "").lower() == status]
+    if requester:
+        requester = requester.lower()
+        entries = [
+            e for e in entries
+            if requester in (e.get("name") or "").lower()
+            or requester in (e.get("email") or "").lower()
+        ]
+    if date_from:
+        entries = [e for e in entries if e["time"][:10] >= date_from]
+    if date_to:
+        entries = [e for e in entries if e["time"][:10] <= date_to]
+
+    entries.sort(key=lambda e: (e["time"], e["file_name"]), reverse=descending)
+    total = len(entries)
+
+    if cursor:
+        last_key = _decode_request_cursor(cursor)
+        if descending:
+            entries = [e for e in entries if (e["time"], e["file_name"]) < last_key]
+        else:
+            entries = [e for e in entries if (e["time"], e["file_name"]) > last_key]
+
+    next_cursor = None
+    if page_size is not None:
+        page_size = min(max(int(page_size), 1), REQUESTS_MAX_PAGE_SIZE)
+        if len(entries) > page_size:
+            entries = entries[:page_size]
+            next_cursor = _encode_request_cursor(entries[-1])
+    return {"requests": entries, "next_cursor": next_cursor, "total": total}
+
+
+def get_requests():
+    return list_requests()["requests"]
+
+
+REQUEST_STATUS_MAX_RETRIES = 8
+
+
+def update_request_status(file_name, status):
+    """
+    Set the status of a stored request. The request JSON is rewritten with an
+    If-Match precondition on the ETag it was read at (re-reading on conflict),
+    then the index entry and the local request cache are updated so the
+    listing reflects the change without re-scanning the bucket.
+    """
+    try:
+        status = RequestStatus(str(status or "").lower()).value
+    except ValueError:
+        allowed = ", ".join(s.value for s in RequestStatus)
+        return {"success": False, "status": 400, "message": f"status must be one of: {allowed}"}
+    if not file_name or "/" in file_name or file_name.startswith("_"):
+        return {"success": False, "status": 400, "message": "Invalid file name"}
+
+    s3_client = get_s3_client()
+    key = REQUESTS_PREFIX + file_name
+    for attempt in range(REQUEST_STATUS_MAX_RETRIES):
+        try:
+            response = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
+        except s3_client.exceptions.NoSuchKey:
+            return {"success": False, "status": 404, "message": "Request not found"}
+        document = json.loads(response["Body"].read().decode("utf-8"))
+        document["status"] = status
+        document["status_updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        body = json.dumps(document)
+        try:
+            put_response = s3_client.put_object(
+                Bucket=BUCKET_NAME,
+                Key=key,
+                Body=body.encode("utf-8"),
+                ContentType="application/json",
+                IfMatch=response["ETag"],
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in CONDITIONAL_WRITE_CONFLICTS:
+                raise
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+            continue
+        _write_request_cache(key, put_response["ETag"], body)
+        try:
+            entry = _request_index_entry(file_name, document)
+            update_request_index(lambda index: index["requests"].update({file_name: entry}))
+        except Exception as e:
+            # The request itself is updated; rebuild-request-index recovers the entry
+            print(f"Error updating request index for {file_name}: {e}")
+        return {"success": True, "request": _format_request(file_name, document)}
+    return {"success": False, "status": 409, "message": "Request was modified concurrently, try again"}
+
+
+# Request analytics: how often each metric is requested, how many requests
+# each site could serve (and with how many sessions), and monthly volume.
+# Updated as requests are submitted; site demand is evaluated against the
+# dataset that was current at submission time.
+REQUEST_ANALYTICS_KEY = REQUESTS_PREFIX + "_analytics.json"
+
+
+def _empty_request_analytics():
+    return {"version": 1, "requests": 0, "metrics": {}, "sites": {}, "monthly": {}, "request_files": []}
+
+
+def _request_analytics_contribution(data_request, staticPath=None, rows_count=None, file_name=None):
+    """What one stored request adds to the analytics aggregate."""
+    request_data = data_request["request"]
+    if rows_count is None and staticPath:
+        rows_count = get_filtered_rows_count(staticPath, request_filters(request_data))
+    sessions_per_site = (rows_count or {}).get("sessions_per_site", {})
+    return {
+        "metrics": sorted(request_metric_names(request_data)),
+        "sites": {str(site): int(sessions) for site, sessions in sessions_per_site.items()},
+        "month": data_request["timestamp"][:7],
+        "file_name": file_name,
+    }
+
+
+def _add_analytics_contribution(analytics, contribution):
+    # Counted requests are remembered so a contribution is never added twice
+    # (e.g. by a submission racing a rebuild that already listed it)
+    file_name = contribution.get("file_name")
+    counted = analytics.setdefault("request_files", [])
+    if file_name:
+        if file_name in counted:
+            return False
+        counted.append(file_name)
+    analytics["requests"] += 1
+    for metric in contribution["metrics"]:
+        analytics["metrics"][metric] = analytics["metrics"].get(metric, 0) + 1
+    for site, sessions in contribution["sites"].items():
+        demand = analytics["sites"].setdefault(site, {"requests": 0, "sessions": 0})
+        demand["requests"] += 1
+        demand["sessions"] += sessions
+    month = contribution["month"]
+    analytics["monthly"][month] = analytics["monthly"].get(month, 0) + 1
+    analytics["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def update_request_analytics(mutate):
+    return _update_json_object(REQUEST_ANALYTICS_KEY, _empty_request_analytics, mutate)
+
+
+def rebuild_request_analytics(staticPath):
+    """
+    Recompute the analytics aggregate from every stored request. Request
+    bodies are fetched in parallel and requests with identical filters are
+    only evaluated once.
+    """
+    s3_client = get_s3_client()
+    keys = _list_request_keys(s3_client)
+    with ThreadPoolExecutor(max_workers=REQUESTS_FETCH_WORKERS) as executor:
+        documents = list(executor.map(
+            lambda key: _fetch_request_document(s3_client, key), keys))
+
+    analytics = _empty_request_analytics()
+    counts = {}
+    skipped = 0
+    for key, document in zip(keys, documents):
+        if document is None:
+            continue
+        # One malformed request shouldn't abort the whole recompute
+        try:
+            filters = request_filters(document["request"])
+            filter_key = json.dumps(filters, sort_keys=True)
+            if filter_key not in counts:
+                counts[filter_key] = get_filtered_rows_count(staticPath, filters)
+            contribution = _request_analytics_contribution(
+                document, rows_count=counts[filter_key], file_name=key[len(REQUESTS_PREFIX):])
+        except Exception as e:
+            print(f"Skipping {key} in request analytics: {e!r}")
+            skipped += 1
+            continue
+        _add_analytics_contribution(analytics, contribution)
+
+    # Requests counted by submissions that landed after the listing
+    listed = {key[len(REQUESTS_PREFIX):] for key in keys}
+    late = {}
+
+    def replace(current):
+        merged = json.loads(json.dumps(analytics))
+        for file_name in current.get("request_files", []):
+            if file_name in listed:
+                continue
+            if file_name not in late:
+                late[file_name] = None
+                document = _fetch_request_document(s3_client, REQUESTS_PREFIX + file_name)
+                try:
+                    if document is not None:
+                        late[file_name] = _request_analytics_contribution(
+                            document, staticPath, file_name=file_name)
+                except Exception as e:
+                    print(f"Skipping {file_name} in request analytics: {e!r}")
+            if late[file_name] is not None:
+                _add_analytics_contribution(merged, late[file_name])
+        current.clear()
+        current.update(merged)
+
+    result = update_request_analytics(replace)
+    return dict(result, skipped=skipped)
+
+
+# Re-evaluation reports: each pending request's count against the current
+# dataset, compared with the report produced for the previous dataset version.
+# <version>.json holds the last report for each version; latest.json the
+# first report for the newest version.
+REEVALUATION_PREFIX = REQUESTS_PREFIX + "_reevaluation/"
+REEVALUATION_LATEST_KEY = REEVALUATION_PREFIX + "latest.json"
+
+
+def _diff_sessions_per_site(old, new):
+    sites = set(old or {}) | set(new or {})
+    deltas = {site: (new or {}).get(site, 0) - (old or {}).get(site, 0) for site in sorted(sites)}
+    return {site: delta for site, delta in deltas.items() if delta}
+
+
+def reevaluate_requests(staticPath, statuses=("pending",)):
+    """
+    Evaluate the filters of every request with one of `statuses` (taken from
+    the request index) against the current dataset, and write a report of
+    old vs. new counts and per-site deltas. Identical filters are evaluated
+    once, and all of them in a single batch.
+    """
+    start = time.perf_counter()
+    s3_client = get_s3_client()
+    version = BooleanData.getVersion(staticPath)
+    statuses = {status.lower() for status in statuses}
+    entries = [e for e in _read_request_entries() if (e.get("status") or "").lower() in statuses]
+    with ThreadPoolExecutor(max_workers=REQUESTS_FETCH_WORKERS) as executor:
+        documents = list(executor.map(
+            lambda entry: _fetch_request_document(s3_client, REQUESTS_PREFIX + entry["file_name"]),
+            entries))
+
+    distinct = OrderedDict()
+    request_keys = {}
+    for entry, document in zip(entries, documents):
+        if document is None:
+            continue
+        filters = canonical_request_filters(request_filters(document["request"]))
+        filter_key = json.dumps(filters, sort_keys=True)
+        distinct.setdefault(filter_key, filters)
+        request_keys[entry["file_name"]] = filter_key
+    counts = dict(zip(distinct, evaluate_filters_batch(staticPath, list(distinct.values()))))
+
+    # Compare against the last report for a *different* dataset version, so
+    # re-running on an unchanged dataset keeps the real baseline. latest.json
+    # only names the versions; <version>.json has that version's last report.
+    latest, _ = _read_json_object(s3_client, REEVALUATION_LATEST_KEY, lambda: None)
+    previous_version = None
+    if latest:
+        previous_version = latest.get("dataset_version")
+        if previous_version == version:
+            previous_version = latest.get("previous_dataset_version")
+    previous = None
+    if previous_version:
+        previous, _ = _read_json_object(
+            s3_client, f"{REEVALUATION_PREFIX}{previous_version}.json", lambda: None)
+        if previous is None and latest.get("dataset_version") == previous_version:
+            previous = latest
+    previous_results = {r["file_name"]: r for r in (previous or {}).get("requests", [])}
+    results = []
+    for entry in entries:
+        if entry["file_name"] not in request_keys:
+            continue
+        rows_count = counts[request_keys[entry["file_name"]]]
+        old = previous_results.get(entry["file_name"])
+        results.append({
+            "file_name": entry["file_name"],
+            "name": entry["name"],
+            "status": entry["status"],
+            "old_count": old["new_count"] if old else None,
+            "new_count": rows_count["count"],
+            "delta": rows_count["count"] - old["new_count"] if old else None,
+            "sessions_per_site": rows_count["sessions_per_site"],
+            "site_deltas": _diff_sessions_per_site(
+                old["sessions_per_site"], rows_count["sessions_per_site"]) if old else None,
+        })
+
+    report = {
+        "dataset_version": version,
+        "previous_dataset_version": (previous or {}).get("dataset_version"),
+        "generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "requests_evaluated": len(results),
+        "distinct_filters": len(distinct),
+        "elapsed_seconds": round(time.perf_counter() - start, 3),
+        "requests": results,
+    }
+    body = json.dumps(report).encode("utf-8")
+    keys = [f"{REEVALUATION_PREFIX}{version}.json"]
+    # latest.json moves on only with the dataset, so it keeps pointing at the baseline
+    if not latest or latest.get("dataset_version") != version:
+        keys.append(REEVALUATION_LATEST_KEY)
+    for key in keys:
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=body, ContentType="application/json")
+    return report
+
+
+def get_request_analytics(top=None):
+    """The analytics aggregate with metrics and sites ranked by demand."""
+    analytics, _ = _read_json_object(get_s3_client(), REQUEST_ANALYTICS_KEY, _empty_request_analytics)
+    metrics = sorted(analytics["metrics"].items(), key=lambda item: (-item[1], item[0]))
+    sites = sorted(analytics["sites"].items(), key=lambda item: (-item[1]["requests"], item[0]))
+    if top:
+        metrics, sites = metrics[:top], sites[:top]
+    return {
+        "requests": analytics["requests"],
+        "metrics": [{"metric_name": name, "requests": count} for name, count in metrics],
+        "sites": [{"site": site, **demand} for site, demand in sites],
+        "monthly": dict(sorted(analytics["monthly"].items())),
+        "updated": analytics.get("updated"),
+    }
+
+
+def get_request_data_from_storage(filename):
+    s3_client = get_s3_client()
+    file_key = f"{REQUESTS_PREFIX}{filename}"
+    file_content = _get_request_document(s3_client, file_key)
+    data = _format_request(filename, file_content)
     # data = json.loads(file_content)
     return data
 
@@ -1350,49 +2524,27 @@ def update_qc_csv_data(bids_id, ses_id, data):
         return False
     
 
+DATA_REQUEST_ADMINS = AdminList(DATA_REQUEST_ADMINS_BUCKET, DATA_REQUEST_ADMINS_KEY)
+
+
 def get_data_request_admins_list():
-    """Get list of data request admin emails from S3"""
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY,
-        region_name="us-east-1",
-    )
+    """Get list of data request admin emails (cached, revalidated against S3)"""
     try:
-        obj = s3.get_object(Bucket=DATA_REQUEST_ADMINS_BUCKET, Key=DATA_REQUEST_ADMINS_KEY)
-        data = obj["Body"].read().decode("utf-8").splitlines()
-        reader = csv.DictReader(data)
-        admins = [row["email"] for row in reader]
-        return admins
-    except s3.exceptions.NoSuchKey:
-        # File doesn't exist yet, return empty list
-        return []
+        return DATA_REQUEST_ADMINS.emails()
     except Exception as e:
         print(f"Error reading admins from S3: {e}")
         return []
-    
+
+def is_data_request_admin_email(email):
+    try:
+        return DATA_REQUEST_ADMINS.contains(email)
+    except Exception as e:
+        print(f"Error reading admins from S3: {e}")
+        return False
+
 def save_data_request_admins_list(admins):
-    """Save list of data request admin emails to S3"""
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY,
-        region_name="us-east-1",
-    )
-    
-    # Create CSV content
-    output = StringIO()
-    writer = csv.DictWriter(output, fieldnames=["email"])
-    writer.writeheader()
-    for email in admins:
-        writer.writerow({"email": email})
-    
-    # Upload to S3
-    s3.put_object(
-        Bucket=DATA_REQUEST_ADMINS_BUCKET,
-        Key=DATA_REQUEST_ADMINS_KEY,
-        Body=output.getvalue().encode("utf-8")
-    )
+    """Save list of data request admin emails to S3 and the in-memory cache"""
+    DATA_REQUEST_ADMINS.save(admins)
 
 def get_data_request_admins(request):
     """Get list of all data request admins"""
@@ -1415,7 +2567,7 @@ def add_data_request_admin(request):
         admins = get_data_request_admins_list()
         
         # Check if admin already exists
-        if email in admins:
+        if DATA_REQUEST_ADMINS.contains(email):
             return jsonify({"error": "Admin already exists"}), 400
         
         # Add new admin
@@ -1439,11 +2591,11 @@ def delete_data_request_admin(request):
         admins = get_data_request_admins_list()
         
         # Check if admin exists
-        if email not in admins:
+        if not DATA_REQUEST_ADMINS.contains(email):
             return jsonify({"error": "Admin not found"}), 404
         
         # Remove admin
-        admins.remove(email)
+        admins = [admin for admin in admins if admin.strip().lower() != email.strip().lower()]
         save_data_request_admins_list(admins)
         
         return jsonify({"message": f"Admin {email} deleted successfully"}), 200